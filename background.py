@@ -0,0 +1,107 @@
+"""
+This file is part of Urtext for Sublime Text.
+Urtext is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+Urtext is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with Urtext.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import sublime
+import concurrent.futures
+import threading
+import traceback
+from .instrumentation import find_caller, set_caller
+from .circuit_breaker import ServerUnavailableError
+
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+
+class StatusSpinner:
+    """ animates a status bar entry while any background request is in flight """
+    frames = ['[=   ]', '[ =  ]', '[  = ]', '[   =]', '[  = ]', '[ =  ]']
+
+    def __init__(self, key='urtext_busy', interval=100):
+        self.key = key
+        self.interval = interval
+        self.in_flight = 0
+        self.frame = 0
+        self.view = None
+        # whether a _tick is scheduled; only one loop may run at a time
+        self.ticking = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            self.in_flight += 1
+            if self.ticking:
+                return
+            self.ticking = True
+        sublime.set_timeout(self._tick, 0)
+
+    def stop(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _tick(self):
+        window = sublime.active_window()
+        view = window.active_view() if window else None
+        if self.view and self.view != view:
+            self.view.erase_status(self.key)
+        self.view = view
+        with self._lock:
+            self.ticking = self.in_flight > 0
+            ticking = self.ticking
+        if not ticking:
+            if self.view:
+                self.view.erase_status(self.key)
+            self.view = None
+            return
+        if self.view:
+            self.frame = (self.frame + 1) % len(self.frames)
+            self.view.set_status(self.key, 'Urtext ' + self.frames[self.frame])
+        sublime.set_timeout(self._tick, self.interval)
+
+spinner = StatusSpinner()
+
+def run_in_background(function, callback=None, errback=None):
+    """
+    Runs function() on the worker pool and returns its Future.
+    callback(result) or errback(exception) is then called on
+    Sublime's main thread.
+    """
+    spinner.start()
+    # requests made by function are attributed to the command that started it
+    caller = find_caller()
+    def run():
+        set_caller(caller)
+        try:
+            return function()
+        finally:
+            set_caller(None)
+    future = _executor.submit(run)
+
+    def done(future):
+        spinner.stop()
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error:
+            if errback:
+                sublime.set_timeout(lambda: errback(error), 0)
+            elif isinstance(error, ServerUnavailableError):
+                # already shown in the status bar
+                print('Urtext: ' + str(error))
+            else:
+                print('Urtext: background request failed')
+                traceback.print_exception(type(error), error, error.__traceback__)
+            return
+        if callback:
+            result = future.result()
+            sublime.set_timeout(lambda: callback(result), 0)
+
+    future.add_done_callback(done)
+    return future
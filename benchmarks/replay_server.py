@@ -0,0 +1,104 @@
+"""
+This file is part of Urtext for Sublime Text.
+Urtext is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+Urtext is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with Urtext.  If not, see <https://www.gnu.org/licenses/>.
+
+Stand-in Urtext server that answers requests from a recording made
+with the "record_requests_path" setting. A request is answered with
+the recorded response for the same endpoint and values if there is
+one, otherwise with the last recorded response for the endpoint;
+endpoints never recorded answer 404, as an older server would.
+
+    python3 replay_server.py recording.jsonl --port 5000 --latency 5
+"""
+import argparse
+import gzip
+import http.server
+import json
+import socketserver
+import threading
+import time
+import urllib.parse
+
+def request_key(endpoint, values):
+    return (endpoint, tuple(sorted((k, str(v)) for k, v in values.items())))
+
+class Recording:
+
+    def __init__(self, entries=[]):
+        self.exact = {}
+        self.latest = {}
+        for entry in entries:
+            self.add(entry['endpoint'], entry['values'], entry['status'], entry['response'])
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls(json.loads(line) for line in f if line.strip())
+
+    def add(self, endpoint, values, status, response):
+        self.exact[request_key(endpoint, values)] = (status, response)
+        self.latest[endpoint] = (status, response)
+
+    def lookup(self, endpoint, values):
+        found = self.exact.get(request_key(endpoint, values))
+        if found:
+            return found
+        return self.latest.get(endpoint, (404, None))
+
+class ReplayHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        values = dict((k, v[0]) for k, v in
+            urllib.parse.parse_qs(body.decode('utf-8'), keep_blank_values=True).items())
+        endpoint = self.path.strip('/')
+        status, response = self.server.recording.lookup(endpoint, values)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        data = json.dumps(response).encode('utf-8') if status < 400 else b'not recorded'
+        # one write, so replies are not held back by Nagle's algorithm
+        self.wfile.write(
+            ('HTTP/1.1 %d %s\r\n' % (status, 'OK' if status < 400 else 'Error')).encode('ascii') +
+            b'Content-Type: application/json\r\n' +
+            ('Content-Length: %d\r\n\r\n' % len(data)).encode('ascii') +
+            data)
+
+    def log_message(self, format, *args):
+        pass
+
+class ReplayServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, recording, port=5000, latency=0.0):
+        http.server.HTTPServer.__init__(self, ('127.0.0.1', port), ReplayHandler)
+        self.recording = recording
+        self.latency = latency
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay recorded Urtext requests.')
+    parser.add_argument('recording')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--latency', type=float, default=0.0,
+        help='milliseconds added to every response')
+    args = parser.parse_args()
+    server = ReplayServer(Recording.load(args.recording), args.port, args.latency / 1000)
+    print('Replaying %s on port %d' % (args.recording, args.port))
+    server.serve_forever()
@@ -0,0 +1,199 @@
+"""
+This file is part of Urtext for Sublime Text.
+Urtext is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+Urtext is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with Urtext.  If not, see <https://www.gnu.org/licenses/>.
+
+Drives the plugin's commands and listeners against replay_server.py,
+with the stub sublime modules in stubs/, and reports wall time and
+memory allocated per operation.
+
+    python3 run_benchmarks.py                      # synthetic project
+    python3 run_benchmarks.py --recording rec.jsonl --latency 2
+"""
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, 'stubs'))
+sys.path.insert(0, HERE)
+
+import sublime
+from replay_server import Recording, ReplayServer
+
+PROJECT = '/bench/project'
+
+def load_plugin():
+    """ imports the plugin package from the parent directory """
+    package_dir = os.path.dirname(HERE)
+    spec = importlib.util.spec_from_file_location(
+        'urtext_plugin',
+        os.path.join(package_dir, '__init__.py'),
+        submodule_search_locations=[package_dir])
+    package = importlib.util.module_from_spec(spec)
+    sys.modules['urtext_plugin'] = package
+    spec.loader.exec_module(package)
+    import urtext_plugin.sublime_urtext
+    import urtext_plugin.traverse
+    return urtext_plugin
+
+def synthetic_recording(node_count, history_count=200):
+    recording = Recording()
+    nodes = [{
+        'id' : '%03x' % i,
+        'title' : 'Node number %d' % i,
+        'date' : 'Mon., Jan. 01, 2024, 10:00 AM',
+        'filename' : os.path.join(PROJECT, '%03x.txt' % i),
+        'position' : 0,
+        'project_title' : 'bench',
+        } for i in range(node_count)]
+    recording.add('nodes', {}, 200, {'revision' : 1, 'nodes' : nodes})
+    recording.add('nodes-query', {}, 200, {
+        'nodes' : nodes[:100], 'more' : node_count > 100})
+    recording.add('nodes-since', {}, 200, {'revision' : 1, 'changed' : [], 'removed' : []})
+    recording.add('filenames-from-links', {}, 200, {'targets' : dict(
+        (node['id'], {'filename' : node['filename'], 'position' : 0}) for node in nodes[:50])})
+    recording.add('filename-from-link', {}, 200, {
+        'filename' : nodes[1]['filename'], 'position' : 0})
+    recording.add('modified', {}, 200, {
+        'completions' : ['tag::value %d' % i for i in range(2000)],
+        'titles' : dict((node['title'], node['id']) for node in nodes[:2000]),
+        'filename' : nodes[0]['filename'],
+        })
+    recording.add('snapshot-diff', {}, 200, {'success' : True})
+    history = dict((str(1700000000 + 60 * i), '[]') for i in range(history_count))
+    recording.add('get-history', {}, 200, {
+        'history' : json.dumps(history),
+        'timestamp-format' : '%a., %b. %d, %Y, %I:%M:%S %p',
+        })
+    recording.add('apply-patches', {}, 200, {
+        'state' : ''.join('line %d of an old version\n' % i for i in range(5000))})
+    recording.add('node-ranges', {}, 200, {'ranges' : [[0, 10000, '000']]})
+    return recording
+
+def pump(plugin, timeout=30):
+    """ runs queued main-thread callbacks until all background work is done """
+    background = plugin.background
+    scheduler = plugin.sublime_urtext.save_scheduler
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        waiting = sublime.run_due_timeouts()
+        busy = background.spinner.in_flight or scheduler.depth() or scheduler.running
+        if not waiting and not busy:
+            return
+        time.sleep(0.001)
+    raise RuntimeError('background work did not finish')
+
+def measure(name, operation, plugin, iterations):
+    times = []
+    peaks = []
+    for i in range(iterations):
+        tracemalloc.start()
+        start = time.perf_counter()
+        operation()
+        pump(plugin)
+        times.append(time.perf_counter() - start)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    times.sort()
+    print('%-34s %9.2f ms %9.2f ms %10.1f KiB' % (
+        name,
+        1000 * times[len(times) // 2],
+        1000 * times[-1],
+        max(peaks) / 1024))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Urtext plugin.')
+    parser.add_argument('--recording', help='JSONL file made with record_requests_path')
+    parser.add_argument('--nodes', type=int, default=20000,
+        help='nodes in the synthetic project (without --recording)')
+    parser.add_argument('--latency', type=float, default=0.0,
+        help='milliseconds the replay server adds to every response')
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--port', type=int, default=5099)
+    args = parser.parse_args()
+
+    recording = Recording.load(args.recording) if args.recording else synthetic_recording(args.nodes)
+    server = ReplayServer(recording, args.port, args.latency / 1000).start()
+
+    plugin = load_plugin()
+    su = plugin.sublime_urtext
+    # the status bar animation would keep the timeout queue busy
+    plugin.background.spinner._tick = lambda: None
+    sublime.load_settings('urtext.sublime-settings').set(
+        'server_url', 'http://127.0.0.1:%d/' % args.port)
+
+    window = sublime.Window(groups=2)
+    sublime.set_active_window(window)
+    links = ' '.join('>%03x' % i for i in range(1, 40))
+    tree_view = window.add_view(sublime.View(
+        filename=os.path.join(PROJECT, 'index.txt'),
+        text=''.join('entry %d %s\n' % (i, links) for i in range(200))), 0)
+    tree_view.settings().set('traverse', 'true')
+    file_view = window.add_view(sublime.View(
+        filename=os.path.join(PROJECT, 'log.txt'),
+        text=''.join('log line %d\n' % i for i in range(5000))), 0)
+    # as Sublime would when the plugin loads with these files open
+    su.plugin_loaded()
+
+    print('%-34s %12s %12s %14s' % ('operation', 'median', 'max', 'peak alloc'))
+
+    def open_node_browser():
+        su.NodeBrowserCommand(file_view).run(None)
+    measure('NodeBrowserCommand', open_node_browser, plugin, args.iterations)
+
+    traverse = plugin.traverse.TraverseFileTree()
+    def traverse_step():
+        window.focus_group(0)
+        window.focus_view(tree_view)
+        tree_view.sel().clear()
+        tree_view.sel().add(tree_view.text_point(traverse_step.row % 200, 0))
+        traverse_step.row += 1
+        traverse.on_selection_modified(tree_view)
+    traverse_step.row = 0
+    measure('TraverseFileTree step', traverse_step, plugin, args.iterations)
+
+    save_listener = su.UrtextSaveListener()
+    def save():
+        save_listener.on_post_save(file_view)
+    measure('UrtextSaveListener save', save, plugin, args.iterations)
+
+    def complete():
+        save_listener.on_query_completions(file_view, 'val', [0])
+    measure('on_query_completions', complete, plugin, args.iterations)
+
+    history_window = sublime.Window(groups=2)
+    sublime.set_active_window(history_window)
+    history_file = history_window.add_view(sublime.View(
+        filename=os.path.join(PROJECT, 'log.txt'), text=file_view.text), 0)
+    history_view = history_window.add_view(sublime.View(name='urtext_history'), 1)
+    history_window.focus_group(1)
+    history = su.TraverseHistoryView()
+    history.on_selection_modified(history_view)
+    pump(plugin)
+    def history_step():
+        history_view.sel().clear()
+        history_view.sel().add(history_view.text_point(1 + history_step.row % 5, 0))
+        history_step.row += 1
+        history.on_selection_modified(history_view)
+    history_step.row = 0
+    measure('history traversal step', history_step, plugin, args.iterations)
+
+    server.shutdown()
+    print()
+    print(su.connection_report())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,385 @@
+"""
+Minimal stand-in for Sublime Text's sublime module, enough to drive the
+plugin's commands and listeners outside the editor in benchmarks.
+Timeouts are queued and run by pump() on the benchmark's main thread.
+"""
+import re
+import threading
+import time
+
+IGNORECASE = 2
+INHIBIT_WORD_COMPLETIONS = 8
+TRANSIENT = 4
+DIALOG_YES = 1
+
+_timeouts = []
+_timeouts_lock = threading.Lock()
+_settings = {}
+_active_window = None
+
+def set_timeout(callback, delay=0):
+    with _timeouts_lock:
+        _timeouts.append((time.time() + delay / 1000, callback))
+
+set_timeout_async = set_timeout
+
+def run_due_timeouts():
+    """ runs the timeouts that are due; returns how many are still waiting """
+    now = time.time()
+    with _timeouts_lock:
+        due = [t for t in _timeouts if t[0] <= now]
+        for t in due:
+            _timeouts.remove(t)
+        waiting = len(_timeouts)
+    for _, callback in sorted(due, key=lambda t: t[0]):
+        callback()
+    return waiting + len(due)
+
+def load_settings(name):
+    return _settings.setdefault(name, Settings())
+
+def active_window():
+    return _active_window
+
+def windows():
+    return [_active_window] if _active_window else []
+
+def set_active_window(window):
+    global _active_window
+    _active_window = window
+
+def platform():
+    return 'linux'
+
+def message_dialog(message):
+    pass
+
+def yes_no_cancel_dialog(message):
+    return DIALOG_YES
+
+def set_clipboard(text):
+    pass
+
+def status_message(message):
+    pass
+
+class Region:
+    def __init__(self, a, b=None):
+        self.a = a
+        self.b = a if b is None else b
+
+    def begin(self):
+        return min(self.a, self.b)
+
+    def end(self):
+        return max(self.a, self.b)
+
+    def empty(self):
+        return self.a == self.b
+
+    def __eq__(self, other):
+        return isinstance(other, Region) and (self.a, self.b) == (other.a, other.b)
+
+class Selection(list):
+    def clear(self):
+        del self[:]
+
+    def add(self, region):
+        if not isinstance(region, Region):
+            region = Region(region)
+        self.append(region)
+
+class Settings(dict):
+    def get(self, key, default=None):
+        return dict.get(self, key, default)
+
+    def set(self, key, value):
+        self[key] = value
+
+    def has(self, key):
+        return key in self
+
+    def erase(self, key):
+        self.pop(key, None)
+
+    def add_on_change(self, key, callback):
+        pass
+
+    def clear_on_change(self, key):
+        pass
+
+class Sheet:
+    def __init__(self, view):
+        self._view = view
+
+    def view(self):
+        return self._view
+
+class View:
+    _next_id = 1
+
+    def __init__(self, window=None, filename=None, text='', name=''):
+        self._id = View._next_id
+        View._next_id += 1
+        self._window = window
+        self._filename = filename
+        self._name = name
+        self.text = text
+        self._sel = Selection([Region(0)])
+        self._settings = Settings()
+        self._status = {}
+        self._change_count = 0
+        self.read_only = False
+
+    def id(self):
+        return self._id
+
+    def window(self):
+        return self._window
+
+    def is_valid(self):
+        return self._window is not None
+
+    def file_name(self):
+        return self._filename
+
+    def name(self):
+        return self._name
+
+    def set_name(self, name):
+        self._name = name
+
+    def size(self):
+        return len(self.text)
+
+    def substr(self, region):
+        if isinstance(region, int):
+            return self.text[region:region + 1]
+        return self.text[region.begin():region.end()]
+
+    def line(self, region):
+        if isinstance(region, Region):
+            region = region.begin()
+        start = self.text.rfind('\n', 0, region) + 1
+        end = self.text.find('\n', region)
+        return Region(start, len(self.text) if end == -1 else end)
+
+    def full_line(self, region):
+        line = self.line(region)
+        return Region(line.a, min(line.b + 1, len(self.text)))
+
+    def rowcol(self, position):
+        row = self.text.count('\n', 0, position)
+        return row, position - (self.text.rfind('\n', 0, position) + 1)
+
+    def text_point(self, row, col):
+        offset = 0
+        for i in range(row):
+            offset = self.text.index('\n', offset) + 1
+        return offset + col
+
+    def sel(self):
+        return self._sel
+
+    def settings(self):
+        return self._settings
+
+    def change_count(self):
+        return self._change_count
+
+    def is_loading(self):
+        return False
+
+    def is_dirty(self):
+        return False
+
+    def is_scratch(self):
+        return False
+
+    def set_scratch(self, scratch):
+        pass
+
+    def set_read_only(self, read_only):
+        self.read_only = read_only
+
+    def set_syntax_file(self, syntax):
+        pass
+
+    def set_status(self, key, value):
+        self._status[key] = value
+
+    def erase_status(self, key):
+        self._status.pop(key, None)
+
+    def show(self, *args, **kwargs):
+        pass
+
+    def show_at_center(self, *args):
+        pass
+
+    def set_viewport_position(self, *args, **kwargs):
+        pass
+
+    def visible_region(self):
+        return Region(0, len(self.text))
+
+    def find_all(self, pattern, flags=0):
+        return [Region(m.start(), m.end())
+            for m in re.finditer(re.escape(pattern), self.text, re.I if flags & IGNORECASE else 0)]
+
+    def add_regions(self, *args, **kwargs):
+        pass
+
+    def show_popup(self, *args, **kwargs):
+        pass
+
+    def retarget(self, filename):
+        self._filename = filename
+
+    def close(self):
+        if self._window:
+            self._window.close_view(self)
+
+    def replace(self, edit, region, text):
+        self.text = self.text[:region.begin()] + text + self.text[region.end():]
+        self._change_count += 1
+
+    def insert(self, edit, position, text):
+        self.replace(edit, Region(position), text)
+        return len(text)
+
+    def erase(self, edit, region):
+        self.replace(edit, region, '')
+
+    def run_command(self, name, args={}):
+        if name in ['append', 'insert']:
+            self.replace(None, Region(len(self.text)) if name == 'append'
+                else self._sel[0], args.get('characters', ''))
+            return
+        if name == 'insert_snippet':
+            self.replace(None, self._sel[0], args.get('contents', ''))
+            return
+        if name == 'select_all':
+            self._sel = Selection([Region(0, len(self.text))])
+            return
+        if name in ['right_delete', 'save', 'revert']:
+            return
+        import sublime_plugin
+        command = sublime_plugin.find_text_command(name)
+        if command:
+            command(self).run(None, **args)
+
+    def __eq__(self, other):
+        return isinstance(other, View) and other._id == self._id
+
+    def __hash__(self):
+        return self._id
+
+class Window:
+    _next_id = 1
+
+    def __init__(self, groups=2):
+        self._id = Window._next_id
+        Window._next_id += 1
+        self._groups = [[] for i in range(groups)]
+        self._active_group = 0
+        self.quick_panels = []
+
+    def id(self):
+        return self._id
+
+    def new_file(self):
+        view = View(window=self)
+        self._groups[self._active_group].append(view)
+        return view
+
+    def add_view(self, view, group=0):
+        view._window = self
+        self._groups[group].append(view)
+        return view
+
+    def open_file(self, filename, flags=0):
+        view = self.find_open_file(filename)
+        if view:
+            return view
+        return self.add_view(View(window=self, filename=filename), self._active_group)
+
+    def find_open_file(self, filename):
+        for view in self.views():
+            if view.file_name() == filename:
+                return view
+        return None
+
+    def close_view(self, view):
+        for group in self._groups:
+            if view in group:
+                group.remove(view)
+        view._window = None
+
+    def views(self):
+        return [view for group in self._groups for view in group]
+
+    def views_in_group(self, group):
+        return list(self._groups[group])
+
+    def num_groups(self):
+        return len(self._groups)
+
+    def active_group(self):
+        return self._active_group
+
+    def focus_group(self, group):
+        self._active_group = group
+
+    def focus_view(self, view):
+        for i, group in enumerate(self._groups):
+            if view in group:
+                self._active_group = i
+
+    def active_view(self):
+        return self.active_view_in_group(self._active_group)
+
+    def active_view_in_group(self, group):
+        return self._groups[group][-1] if self._groups[group] else None
+
+    def active_sheet_in_group(self, group):
+        view = self.active_view_in_group(group)
+        return Sheet(view) if view else None
+
+    def get_view_index(self, view):
+        for i, group in enumerate(self._groups):
+            if view in group:
+                return i, group.index(view)
+        return -1, -1
+
+    def set_view_index(self, view, group, index):
+        self.close_view(view)
+        view._window = self
+        self._groups[group].insert(index, view)
+
+    def set_layout(self, layout):
+        pass
+
+    def folders(self):
+        return []
+
+    def project_data(self):
+        return None
+
+    def extract_variables(self):
+        return {}
+
+    def show_quick_panel(self, items, on_select, *args, **kwargs):
+        self.quick_panels.append(items)
+
+    def show_input_panel(self, *args, **kwargs):
+        pass
+
+    def run_command(self, name, args={}):
+        pass
+
+    def create_output_panel(self, name):
+        return View(window=self, name=name)
+
+    def destroy_output_panel(self, name):
+        pass
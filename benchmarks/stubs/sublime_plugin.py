@@ -0,0 +1,35 @@
+"""
+Minimal stand-in for Sublime Text's sublime_plugin module. Text
+commands register themselves so the stub View.run_command can find
+them by their snake_case name, as Sublime does.
+"""
+import re
+
+_text_commands = {}
+
+def command_name(cls):
+    name = cls.__name__
+    if name.endswith('Command'):
+        name = name[:-len('Command')]
+    return re.sub(r'(?<!^)(?=[A-Z])', '_', name).lower()
+
+def find_text_command(name):
+    return _text_commands.get(name)
+
+class TextCommand:
+    def __init__(self, view):
+        self.view = view
+
+    def __init_subclass__(cls, **kwargs):
+        _text_commands[command_name(cls)] = cls
+
+class WindowCommand:
+    def __init__(self, window):
+        self.window = window
+
+class EventListener:
+    pass
+
+class ViewEventListener:
+    def __init__(self, view):
+        self.view = view
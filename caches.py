@@ -0,0 +1,116 @@
+"""
+This file is part of Urtext for Sublime Text.
+Urtext is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+Urtext is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with Urtext.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import threading
+from collections import OrderedDict
+
+class LRUCache:
+    """ 
+    bounded, thread-safe mapping that evicts the least recently used entry.
+    Given weigh (e.g. len), it also keeps the total weight of its values 
+    within max_weight, though the newest entry is always kept.
+    """
+    def __init__(self, max_size=128, max_weight=None, weigh=None):
+        self.max_size = max_size
+        self.max_weight = max_weight
+        self.weigh = weigh
+        self.weights = {}
+        self.weight = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.entries:
+                return default
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self._discard_weight(key)
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            if self.weigh:
+                self.weights[key] = self.weigh(value)
+                self.weight += self.weights[key]
+            while len(self.entries) > self.max_size or (
+                    self.max_weight is not None 
+                    and self.weight > self.max_weight 
+                    and len(self.entries) > 1):
+                oldest, _ = self.entries.popitem(last=False)
+                self._discard_weight(oldest)
+
+    def _discard_weight(self, key):
+        self.weight -= self.weights.pop(key, 0)
+
+    def pop(self, key, default=None):
+        with self.lock:
+            self._discard_weight(key)
+            return self.entries.pop(key, default)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.weights.clear()
+            self.weight = 0
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+class RevisionedCache:
+    """
+    LRU cache of values per project, each valid only at the project 
+    revision it was stored under. Moving a project to a new revision
+    makes its entries stale without walking the cache.
+    """
+    def __init__(self, max_size=1000):
+        self.entries = LRUCache(max_size)
+        self.revisions = {}
+        self.local_revisions = 0
+        self.lock = threading.Lock()
+
+    def revision(self, project):
+        with self.lock:
+            return self.revisions.get(project)
+
+    def set_revision(self, project, revision):
+        with self.lock:
+            self.revisions[project] = revision
+
+    def invalidate(self, project, revision=None):
+        """ 
+        marks the project as changed; without a server revision, 
+        a local one stands in for it.
+        """
+        with self.lock:
+            if revision is None:
+                self.local_revisions += 1
+                revision = ('local', self.local_revisions)
+            self.revisions[project] = revision
+
+    def get(self, project, key, default=None):
+        entry = self.entries.get((project, key))
+        if entry is None or entry[0] != self.revision(project):
+            return default
+        return entry[1]
+
+    def set(self, project, key, value, revision):
+        """ stores value if revision is still the project's current one """
+        if revision == self.revision(project):
+            self.entries.set((project, key), (revision, value))
@@ -0,0 +1,101 @@
+"""
+This file is part of Urtext for Sublime Text.
+Urtext is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+Urtext is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with Urtext.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import threading
+import time
+
+class ServerUnavailableError(ConnectionError):
+    """ raised instead of a request while a server's circuit is open """
+
+class CircuitBreaker:
+    """
+    Tracks consecutive connection failures to one server. After
+    failure_threshold of them the circuit opens: allow() returns False,
+    so calls fail at once instead of waiting on a server that is down,
+    and probe() is retried in the background, waiting cooldown seconds
+    and doubling up to max_cooldown after each failed probe. The circuit
+    closes when a probe or a request succeeds. on_change(breaker) is 
+    called whenever the circuit opens, closes or schedules a retry.
+    """
+    def __init__(self, probe, failure_threshold=3, cooldown=1.0, max_cooldown=60.0, on_change=None):
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.on_change = on_change
+        self.failures = 0
+        self.is_open = False
+        self.retry_at = None
+        self.delay = cooldown
+        # retries left over from an earlier opening are dropped
+        self.opened = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            return not self.is_open
+
+    def record_success(self):
+        with self.lock:
+            was_open = self.is_open
+            self.failures = 0
+            self.is_open = False
+            self.retry_at = None
+            self.delay = self.cooldown
+        if was_open:
+            self._changed()
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.is_open or self.failures < self.failure_threshold:
+                return
+            self.is_open = True
+            self.opened += 1
+            self.delay = self.cooldown
+            opened = self.opened
+        self._schedule_retry(opened)
+
+    def _schedule_retry(self, opened):
+        with self.lock:
+            delay = self.delay
+            self.retry_at = time.time() + delay
+        timer = threading.Timer(delay, self._retry, [opened])
+        timer.daemon = True
+        timer.start()
+        self._changed()
+
+    def _retry(self, opened):
+        with self.lock:
+            if not self.is_open or opened != self.opened:
+                return
+        try:
+            self.probe()
+        except Exception:
+            with self.lock:
+                if not self.is_open or opened != self.opened:
+                    return
+                self.delay = min(self.delay * 2, self.max_cooldown)
+            self._schedule_retry(opened)
+            return
+        self.record_success()
+
+    def seconds_until_retry(self):
+        with self.lock:
+            if self.retry_at is None:
+                return None
+            return max(0, self.retry_at - time.time())
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change(self)
@@ -0,0 +1,38 @@
+"""
+This file is part of Urtext for Sublime Text.
+Urtext is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+Urtext is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with Urtext.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import bisect
+
+class CompletionIndex:
+    """
+    Sublime completions ([trigger, contents] pairs) sorted by lowercased
+    trigger, so every completion starting with a prefix lies in one
+    contiguous slice, found by bisection.
+    """
+    def __init__(self, completions=[]):
+        entries = sorted(
+            (completion[0].split('\t')[0].lower(), completion)
+            for completion in completions)
+        self.keys = [entry[0] for entry in entries]
+        self.completions = [entry[1] for entry in entries]
+
+    def matching(self, prefix, limit=None):
+        prefix = prefix.lower()
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + '\U0010ffff')
+        if limit:
+            end = min(end, start + limit)
+        return self.completions[start:end]
+
+    def __len__(self):
+        return len(self.completions)
@@ -0,0 +1,268 @@
+"""
+This file is part of Urtext for Sublime Text.
+Urtext is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+Urtext is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with Urtext.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import http.client
+import select
+import socket
+import threading
+import time
+import urllib.parse
+
+# the server closed the connection without sending a status line 
+# (RemoteDisconnected is new in Python 3.5)
+RemoteDisconnected = getattr(
+    http.client, 'RemoteDisconnected', http.client.BadStatusLine)
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """ HTTP over a Unix domain socket """
+    def __init__(self, socket_path):
+        http.client.HTTPConnection.__init__(self, 'localhost')
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+class StreamLines:
+    """
+    The lines of a streamed response. abort() may be called from 
+    another thread to end a read that is waiting on the server.
+    """
+    def __init__(self, lines, connection):
+        self.lines = lines
+        self.connection = connection
+
+    def __iter__(self):
+        return self.lines
+
+    def __next__(self):
+        return next(self.lines)
+
+    def close(self):
+        self.lines.close()
+
+    def abort(self):
+        sock = self.connection.sock
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+class UrtextConnectionPool:
+    """
+    Keeps HTTP/1.1 connections to the Urtext server open and hands them
+    out to callers one at a time, so each request does not pay for a new
+    connection. Connects over TCP, or over a Unix domain socket if 
+    socket_path is given. Safe to use from several threads.
+
+    timeout (in seconds, None to wait forever) bounds connecting and
+    each wait for data; socket.timeout is raised when it runs out.
+    """
+    def __init__(self, host='127.0.0.1', port=5000, socket_path=None, max_idle=4):
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        self.stats = {
+            'requests' : 0,
+            'opened' : 0,
+            'reused' : 0,
+            'reconnects' : 0,
+            'reused_time' : 0.0,
+            'fresh_time' : 0.0,
+            }
+
+    @classmethod
+    def from_url(cls, url, **kwargs):
+        """ 
+        accepts http://host:port/ or unix:///path/to/socket 
+        """
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme == 'unix':
+            return cls(socket_path=parts.path, **kwargs)
+        return cls(
+            host=parts.hostname or '127.0.0.1',
+            port=parts.port or 80,
+            **kwargs)
+
+    def _new_connection(self):
+        with self._lock:
+            self.stats['opened'] += 1
+        if self.socket_path:
+            return UnixHTTPConnection(self.socket_path)
+        return http.client.HTTPConnection(self.host, self.port)
+
+    def _acquire(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                connection = self._idle.pop()
+            if self._is_open(connection):
+                with self._lock:
+                    self.stats['reused'] += 1
+                return connection, True
+            connection.close()
+        return self._new_connection(), False
+
+    def _is_open(self, connection):
+        """
+        An idle connection has nothing to read; if its socket is readable
+        the server has closed it (or sent something unexpected).
+        """
+        sock = connection.sock
+        if sock is None:
+            return False
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        return not readable
+
+    def _release(self, connection):
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+    def request(self, method, path, body=None, headers={}, timeout=None):
+        """
+        Sends one request and returns (status, headers, body).
+        """
+        start = time.time()
+        connection, reused, response = self._open(method, path, body, headers, timeout)
+        try:
+            data = response.read()
+        except (http.client.HTTPException, OSError):
+            connection.close()
+            raise
+        self._finish(connection, response)
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats['reused_time' if reused else 'fresh_time'] += time.time() - start
+        return response.status, response.getheaders(), data
+
+    def open_stream(self, method, path, body=None, headers={}, timeout=None):
+        """
+        Sends one request and returns (status, headers, lines), where lines
+        (a StreamLines) yields the response body line by line as the server 
+        sends it. Closing lines before the end also closes its connection.
+        Round trip time is counted up to the response headers.
+        """
+        start = time.time()
+        connection, reused, response = self._open(method, path, body, headers, timeout)
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats['reused_time' if reused else 'fresh_time'] += time.time() - start
+
+        def lines():
+            complete = False
+            try:
+                for line in response:
+                    yield line
+                complete = True
+            finally:
+                if complete:
+                    self._finish(connection, response)
+                else:
+                    connection.close()
+
+        return response.status, response.getheaders(), StreamLines(lines(), connection)
+
+    def _open(self, method, path, body, headers, timeout):
+        """
+        Sends the request and returns (connection, reused, response) with
+        the body still unread. A connection that has gone stale since it 
+        was last used (for instance because the server restarted) is 
+        replaced and the request is sent once more on a fresh connection,
+        but only if the request could not be written or the server closed
+        the connection without answering: the server may already have 
+        acted on a request that failed later, and most requests change 
+        the project. A request that timed out is not sent again.
+        """
+        connection, reused = self._acquire()
+        try:
+            self._send(connection, method, path, body, headers, timeout)
+            return connection, reused, connection.getresponse()
+        except socket.timeout:
+            connection.close()
+            raise
+        except RemoteDisconnected:
+            connection.close()
+            if not reused:
+                raise
+        except (http.client.HTTPException, OSError) as e:
+            connection.close()
+            if not reused or not getattr(e, 'urtext_unsent', False):
+                raise
+        with self._lock:
+            self.stats['reconnects'] += 1
+        connection = self._new_connection()
+        try:
+            self._send(connection, method, path, body, headers, timeout)
+            return connection, False, connection.getresponse()
+        except (http.client.HTTPException, OSError):
+            connection.close()
+            raise
+
+    def _send(self, connection, method, path, body, headers, timeout):
+        connection.timeout = timeout
+        if connection.sock:
+            connection.sock.settimeout(timeout)
+        try:
+            connection.request(method, path, body=body, headers=headers)
+        except (http.client.HTTPException, OSError) as e:
+            # the request did not reach the server
+            e.urtext_unsent = True
+            raise
+
+    def _finish(self, connection, response):
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(connection)
+
+    def report(self):
+        with self._lock:
+            stats = dict(self.stats)
+        fresh = stats['requests'] - stats['reused'] + stats['reconnects']
+        reused = stats['reused'] - stats['reconnects']
+        lines = [
+            'requests: %d' % stats['requests'],
+            'connections opened: %d' % stats['opened'],
+            'connections reused: %d' % stats['reused'],
+            'reconnects after stale connection: %d' % stats['reconnects'],
+            ]
+        if fresh > 0:
+            lines.append('mean round trip, new connection: %.1f ms' % (
+                1000 * stats['fresh_time'] / fresh))
+        if reused > 0:
+            lines.append('mean round trip, reused connection: %.1f ms' % (
+                1000 * stats['reused_time'] / reused))
+        return '\n'.join(lines)
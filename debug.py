@@ -1,15 +1,38 @@
 import sublime
 import sublime_plugin
-from .sublime_urtext import urtext_get
+from .sublime_urtext import urtext_get_async, connection_report, save_scheduler, request_stats
 
 class DebugCommand(sublime_plugin.TextCommand):
 
     def run(self, view):
         position = self.view.sel()[0].a
-        s = urtext_get('log-node-meta', {'filename' : self.view.file_name(), 'position' : position})
+        urtext_get_async('log-node-meta', {'filename' : self.view.file_name(), 'position' : position})
 
 class UrtextTurnOffThreadingCommand(sublime_plugin.TextCommand):
 
     def run(self, view):
-        s=urtext_get('/async-off')
-        print(s)
+        urtext_get_async('/async-off', callback=print)
+
+class UrtextConnectionStatsCommand(sublime_plugin.TextCommand):
+
+    def run(self, view):
+        print(connection_report())
+
+class UrtextSaveQueueStatsCommand(sublime_plugin.TextCommand):
+
+    def run(self, view):
+        print(save_scheduler.report())
+
+class UrtextRequestStatsCommand(sublime_plugin.TextCommand):
+
+    def run(self, edit):
+        stats_view = self.view.window().new_file()
+        stats_view.set_scratch(True)
+        stats_view.set_name('Urtext Request Stats')
+        stats_view.run_command('urtext_replace_contents', {
+            'text' : request_stats.report() + '\n\n' + connection_report() + '\n'})
+
+class UrtextClearRequestStatsCommand(sublime_plugin.TextCommand):
+
+    def run(self, edit):
+        request_stats.clear()
@@ -0,0 +1,41 @@
+"""
+This file is part of Urtext for Sublime Text.
+Urtext is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+Urtext is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with Urtext.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import difflib
+
+def line_diff(old, new):
+    """
+    Line-based difference between two texts, as a list of
+    [start, end, replacement] edits: lines start to end (exclusive)
+    of old are replaced by the replacement text.
+    """
+    old_lines = old.splitlines(True)
+    new_lines = new.splitlines(True)
+    # most edits touch one area; matching only what lies between the
+    # common head and tail keeps long, mostly unchanged files cheap
+    head = 0
+    while (head < len(old_lines) and head < len(new_lines)
+            and old_lines[head] == new_lines[head]):
+        head += 1
+    tail = 0
+    while (tail < len(old_lines) - head and tail < len(new_lines) - head
+            and old_lines[-1 - tail] == new_lines[-1 - tail]):
+        tail += 1
+    matcher = difflib.SequenceMatcher(None,
+        old_lines[head:len(old_lines) - tail],
+        new_lines[head:len(new_lines) - tail],
+        autojunk=False)
+    return [
+        [head + i1, head + i2, ''.join(new_lines[head + j1:head + j2])]
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != 'equal']
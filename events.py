@@ -0,0 +1,102 @@
+"""
+This file is part of Urtext for Sublime Text.
+Urtext is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+Urtext is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with Urtext.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import json
+import threading
+
+def parse_events(lines):
+    """ 
+    yields (event, data, id) for each server-sent event read from
+    lines (bytes, as the server sends them); data is decoded JSON
+    """
+    event, data, event_id = 'message', [], None
+    for line in lines:
+        line = line.decode('utf-8').rstrip('\r\n')
+        if not line:
+            if data:
+                yield event, json.loads('\n'.join(data)), event_id
+            event, data, event_id = 'message', [], None
+            continue
+        if line.startswith(':'):
+            # comment; servers send these to keep the connection alive
+            continue
+        field, _, value = line.partition(':')
+        value = value[1:] if value.startswith(' ') else value
+        if field == 'event':
+            event = value
+        elif field == 'data':
+            data.append(value)
+        elif field == 'id':
+            event_id = value
+
+class EventStream:
+    """
+    Keeps a server-sent event stream open on a background thread and 
+    passes each event to handle(event, data) on that thread. 
+    open_stream(last_id) returns the stream's lines, resuming after 
+    the last event received, or None if the server has no event stream,
+    which ends the thread. A dropped stream is reopened after a delay
+    that doubles from min_delay up to max_delay while it keeps failing.
+    handle() is also called with 'connected' and 'disconnected', since
+    events may have been missed while the stream was down.
+    """
+    def __init__(self, open_stream, handle, min_delay=1.0, max_delay=60.0):
+        self.open_stream = open_stream
+        self.handle = handle
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.last_id = None
+        self.connected = False
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """ the thread ends after the next event, heartbeat or timeout """
+        self.stopped.set()
+
+    def _run(self):
+        delay = self.min_delay
+        while not self.stopped.is_set():
+            try:
+                lines = self.open_stream(self.last_id)
+                if lines is None:
+                    return
+                self._set_connected(True)
+                delay = self.min_delay
+                try:
+                    for event, data, event_id in parse_events(lines):
+                        if self.stopped.is_set():
+                            break
+                        if event_id is not None:
+                            self.last_id = event_id
+                        self.handle(event, data)
+                finally:
+                    lines.close()
+            except Exception:
+                # failed to connect, rather than dropped after connecting
+                if not self.connected:
+                    delay = min(delay * 2, self.max_delay)
+            finally:
+                self._set_connected(False)
+            self.stopped.wait(delay)
+
+    def _set_connected(self, connected):
+        if connected != self.connected:
+            self.connected = connected
+            self.handle('connected' if connected else 'disconnected', {})
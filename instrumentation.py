@@ -0,0 +1,108 @@
+"""
+This file is part of Urtext for Sublime Text.
+Urtext is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+Urtext is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with Urtext.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import sublime_plugin
+import sys
+import threading
+from collections import deque
+
+_context = threading.local()
+_plugin_classes = (
+    sublime_plugin.TextCommand,
+    sublime_plugin.WindowCommand,
+    sublime_plugin.EventListener,
+    )
+
+def find_caller():
+    """
+    name of the nearest command or listener on the stack, or else
+    the one that handed the current work to a background thread
+    """
+    frame = sys._getframe(1)
+    while frame:
+        obj = frame.f_locals.get('self')
+        if isinstance(obj, _plugin_classes):
+            return type(obj).__name__
+        frame = frame.f_back
+    return getattr(_context, 'caller', None) or 'unknown'
+
+def set_caller(caller):
+    _context.caller = caller
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class RequestStats:
+    """
+    Per-endpoint call counts, errors, request and response sizes, and
+    the latencies of the most recent calls, from which percentiles are
+    reported. Also counts calls per endpoint and caller.
+    """
+    def __init__(self, samples=1000):
+        self.samples = samples
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+    def record(self, endpoint, seconds, request_bytes, response_bytes, caller, error=False):
+        with self.lock:
+            entry = self.endpoints.get(endpoint)
+            if not entry:
+                entry = self.endpoints[endpoint] = {
+                    'calls' : 0,
+                    'errors' : 0,
+                    'request_bytes' : 0,
+                    'response_bytes' : 0,
+                    'total_time' : 0.0,
+                    'max_time' : 0.0,
+                    'latencies' : deque(maxlen=self.samples),
+                    'callers' : {},
+                    }
+            entry['calls'] += 1
+            entry['errors'] += 1 if error else 0
+            entry['request_bytes'] += request_bytes
+            entry['response_bytes'] += response_bytes
+            entry['total_time'] += seconds
+            entry['max_time'] = max(entry['max_time'], seconds)
+            entry['latencies'].append(seconds)
+            entry['callers'][caller] = entry['callers'].get(caller, 0) + 1
+
+    def clear(self):
+        with self.lock:
+            self.endpoints.clear()
+
+    def report(self):
+        lines = []
+        with self.lock:
+            endpoints = sorted(self.endpoints.items(),
+                key=lambda item: item[1]['total_time'],
+                reverse=True)
+            for endpoint, entry in endpoints:
+                ordered = sorted(entry['latencies'])
+                lines.append(endpoint)
+                lines.append('    calls: %d, errors: %d, total: %.0f ms' % (
+                    entry['calls'], entry['errors'], 1000 * entry['total_time']))
+                lines.append('    p50: %.1f ms, p95: %.1f ms, p99: %.1f ms, max: %.1f ms' % (
+                    1000 * percentile(ordered, 0.50),
+                    1000 * percentile(ordered, 0.95),
+                    1000 * percentile(ordered, 0.99),
+                    1000 * entry['max_time']))
+                lines.append('    sent: %d bytes, received: %d bytes' % (
+                    entry['request_bytes'], entry['response_bytes']))
+                callers = sorted(entry['callers'].items(), key=lambda item: -item[1])
+                lines.append('    callers: ' + ', '.join(
+                    '%s (%d)' % caller for caller in callers))
+        if not lines:
+            return 'No Urtext requests recorded yet.'
+        return '\n'.join(lines)
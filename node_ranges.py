@@ -0,0 +1,33 @@
+"""
+This file is part of Urtext for Sublime Text.
+Urtext is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+Urtext is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with Urtext.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import bisect
+
+class NodeRangeIndex:
+    """
+    Sorted, non-overlapping (start, end, node_id) ranges of one file,
+    as sent by the server, answering position lookups by binary search.
+    Inline nodes split their parent into several ranges, so each
+    position falls in the range of its innermost node.
+    """
+    def __init__(self, ranges):
+        ranges = sorted(ranges)
+        self.starts = [r[0] for r in ranges]
+        self.ends = [r[1] for r in ranges]
+        self.node_ids = [r[2] for r in ranges]
+
+    def node_id_at(self, position):
+        i = bisect.bisect_right(self.starts, position) - 1
+        if i < 0 or position > self.ends[i]:
+            return None
+        return self.node_ids[i]
@@ -0,0 +1,37 @@
+"""
+This file is part of Urtext for Sublime Text.
+Urtext is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+Urtext is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with Urtext.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import json
+import threading
+import time
+
+class RequestRecorder:
+    """
+    Appends every request and its decoded response, with timing,
+    to a JSONL file, for replay by benchmarks/replay_server.py.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+
+    def record(self, path, endpoint, values, status, response, seconds):
+        line = json.dumps({
+            'time' : time.time(),
+            'endpoint' : endpoint,
+            'values' : values,
+            'status' : status,
+            'response' : response,
+            'seconds' : seconds,
+            })
+        with self.lock:
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
@@ -0,0 +1,77 @@
+"""
+This file is part of Urtext for Sublime Text.
+Urtext is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+Urtext is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with Urtext.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import os
+import threading
+import time
+
+DISCOVERY_FILENAME = '.urtext-server'
+
+class ServerRegistry:
+    """
+    Finds the server responsible for a project. Projects are matched
+    against the 'project_servers' setting (a project path or title
+    mapped to a server URL; the longest matching path wins), then against
+    a discovery file written by the server into the project folder or 
+    one of its parents, containing its URL on the first line.
+    """
+    def __init__(self, discovery_ttl=5.0):
+        self.discovery_ttl = discovery_ttl
+        self.discovered = {}
+        self.lock = threading.Lock()
+
+    def server_for(self, project, servers, default):
+        if not project:
+            return default
+        if project in servers:
+            return servers[project]
+        project = os.path.normpath(project)
+        best = None
+        for path, url in servers.items():
+            path = os.path.normpath(path)
+            if project == path or project.startswith(path.rstrip(os.sep) + os.sep):
+                if best is None or len(path) > len(best[0]):
+                    best = (path, url)
+        if best:
+            return best[1]
+        if not os.path.isabs(project):
+            return default
+        return self.discover(project) or default
+
+    def discover(self, project):
+        """ the URL in the nearest discovery file, re-read every discovery_ttl seconds """
+        now = time.time()
+        with self.lock:
+            cached = self.discovered.get(project)
+            if cached and now - cached[0] < self.discovery_ttl:
+                return cached[1]
+        url = None
+        folder = project
+        while True:
+            try:
+                with open(os.path.join(folder, DISCOVERY_FILENAME), encoding='utf-8') as f:
+                    url = f.readline().strip() or None
+                break
+            except (IOError, OSError):
+                pass
+            parent = os.path.dirname(folder)
+            if parent == folder:
+                break
+            folder = parent
+        with self.lock:
+            self.discovered[project] = (now, url)
+        return url
+
+    def discovered_urls(self):
+        with self.lock:
+            return [url for t, url in self.discovered.values() if url]
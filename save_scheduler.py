@@ -0,0 +1,91 @@
+"""
+This file is part of Urtext for Sublime Text.
+Urtext is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+Urtext is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with Urtext.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import concurrent.futures
+import threading
+import time
+import traceback
+
+class SaveScheduler:
+    """
+    Runs at most one job per key (filename) at a time, and jobs for
+    different keys in parallel. Scheduling a key that already has a job
+    waiting replaces that job, so a burst of saves of one file is
+    processed once, with the latest state.
+    """
+    def __init__(self, max_workers=4):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.running = set()
+        self.stats = {
+            'scheduled' : 0,
+            'run' : 0,
+            'coalesced' : 0,
+            'total_lag' : 0.0,
+            'max_lag' : 0.0,
+            }
+
+    def schedule(self, key, function):
+        with self.lock:
+            self.stats['scheduled'] += 1
+            if key in self.pending:
+                # keep the time of the first save still waiting
+                self.pending[key] = (function, self.pending[key][1])
+                self.stats['coalesced'] += 1
+                return
+            self.pending[key] = (function, time.time())
+            if key in self.running:
+                # started when the running job for this key finishes
+                return
+        self.executor.submit(self._run, key)
+
+    def _run(self, key):
+        with self.lock:
+            function, scheduled = self.pending.pop(key)
+            self.running.add(key)
+            lag = time.time() - scheduled
+            self.stats['run'] += 1
+            self.stats['total_lag'] += lag
+            self.stats['max_lag'] = max(self.stats['max_lag'], lag)
+        try:
+            function()
+        except Exception:
+            traceback.print_exc()
+        finally:
+            with self.lock:
+                self.running.discard(key)
+                run_again = key in self.pending
+            if run_again:
+                self.executor.submit(self._run, key)
+
+    def depth(self):
+        with self.lock:
+            return len(self.pending)
+
+    def report(self):
+        with self.lock:
+            stats = dict(self.stats)
+            waiting = len(self.pending)
+            running = len(self.running)
+        lines = [
+            'saves scheduled: %d' % stats['scheduled'],
+            'saves coalesced: %d' % stats['coalesced'],
+            'saves processed: %d' % stats['run'],
+            'waiting: %d, running: %d' % (waiting, running),
+            ]
+        if stats['run']:
+            lines.append('mean lag: %.1f ms, max lag: %.1f ms' % (
+                1000 * stats['total_lag'] / stats['run'],
+                1000 * stats['max_lag']))
+        return '\n'.join(lines)
@@ -17,28 +17,381 @@ import os
 import re
 import datetime
 import time
-import concurrent.futures
+import threading
 import subprocess
 import webbrowser
 from sublime_plugin import EventListener
 import urllib
+import urllib.error
 import json
+import gzip
+import hashlib
+import http.client
+import socket
+from collections import OrderedDict
+from .connection import UrtextConnectionPool
+from .background import run_in_background
+from .node_ranges import NodeRangeIndex
+from .caches import LRUCache, RevisionedCache
+from .completions import CompletionIndex
+from .save_scheduler import SaveScheduler
+from .diffs import line_diff
+from .wire_format import request_headers, decode_response, DEFAULT_RESPONSE_FORMATS
+from .instrumentation import RequestStats, find_caller
+from .recording import RequestRecorder
+from .routing import ServerRegistry
+from .circuit_breaker import CircuitBreaker, ServerUnavailableError
+from .events import EventStream
+from .view_registry import ViewRegistry
 
 _SublimeUrtextWindows = {}
 is_browsing_history = False
 URL = 'http://127.0.0.1:5000/'
 node_id_regex = r'\b[0-9,a-z]{3}\b'
+_connection_pools = {}
+_connection_pools_lock = threading.Lock()
+_circuit_breakers = {}
+_event_streams = {}
+# project revisions announced by servers over their event streams
+_pushed_revisions = {}
+_unsupported_endpoints = set()
+_node_range_indexes = {}
+_history_revisions = {}
+# the last snapshot sent of recently saved files, to diff the next one 
+# against; files that fall out are sent whole
+_snapshot_bases = LRUCache(max_size=16)
+# streaming searches: the Event that cancels each, and its lines once open
+_active_searches = {}
+save_scheduler = SaveScheduler(max_workers=4)
+request_stats = RequestStats()
+request_recorder = RequestRecorder()
+view_registry = ViewRegistry()
+# (filename, position) or None for each link ID, per project; see traverse.py
+link_targets = RevisionedCache(max_size=5000)
+# nodes for each recently chosen keyphrase, per project
+_keyphrase_nodes = RevisionedCache(max_size=64)
+server_registry = ServerRegistry()
+
+def server_url():
+    """ 
+    the Urtext server address from the 'server_url' setting: 
+    http://host:port/ (TCP, the default) or unix:///path/to/socket 
+    """
+    return get_setting('server_url', URL) or URL
 
-def urtext_get(endpoint, values={}):
+def server_for(values):
+    """ 
+    the server for a request, from its project (or the folder of its
+    filename) via the 'project_servers' setting or a discovery file.
+    """
+    project = values.get('project')
+    if not project and values.get('filename'):
+        project = os.path.dirname(values['filename'])
+    return server_registry.server_for(
+        project, 
+        get_setting('project_servers', {}) or {}, 
+        server_url())
+
+def view_server(view):
+    """ 
+    the server for the project of view, for requests whose values 
+    do not name the project or an absolute filename
+    """
+    return server_for({'project' : get_path(view)})
+
+def known_servers():
+    """ the default server, then any others configured or discovered """
+    servers = [server_url()]
+    for url in list((get_setting('project_servers', {}) or {}).values()) + server_registry.discovered_urls():
+        if url not in servers:
+            servers.append(url)
+    return servers
+
+def get_connection_pool(url=None):
+    url = url or server_url()
+    with _connection_pools_lock:
+        if url not in _connection_pools:
+            _connection_pools[url] = UrtextConnectionPool.from_url(url)
+            watch_server(url)
+        return _connection_pools[url]
+
+# endpoints that are slow by nature, and how long to wait for them 
+# (None waits until they finish); 'request_timeouts' overrides these
+SLOW_ENDPOINT_TIMEOUTS = {
+    'reindex' : None,
+    'search' : 60,
+    'search-stream' : 60,
+    'nodes' : 30,
+    'nodes-query' : 30,
+    'keywords' : 30,
+    'keyword-query' : 30,
+    'get-history' : 30,
+    'apply-patches' : 30,
+    # an idle event stream is only read when something happens
+    'events' : 300,
+    }
+
+def request_timeout(endpoint):
+    """ seconds to wait for the server, from 'request_timeouts' or 'request_timeout' """
+    timeouts = dict(SLOW_ENDPOINT_TIMEOUTS)
+    timeouts.update(get_setting('request_timeouts', {}) or {})
+    if endpoint in timeouts:
+        return timeouts[endpoint]
+    return get_setting('request_timeout', 10)
+
+def is_server_failure(endpoint, error):
+    """ 
+    whether error counts towards opening the circuit; an endpoint
+    given longer than the usual timeout is slow, and its timing out
+    does not mean the server is down
+    """
+    if isinstance(error, socket.timeout):
+        timeout = request_timeout(endpoint)
+        return timeout is not None and timeout <= get_setting('request_timeout', 10)
+    return isinstance(error, (OSError, http.client.HTTPException))
+
+def get_circuit_breaker(url):
+    with _connection_pools_lock:
+        if url not in _circuit_breakers:
+            # any HTTP response, even an error, shows the server is back
+            probe = lambda: get_connection_pool(url).request('GET', '/', timeout=2)
+            _circuit_breakers[url] = CircuitBreaker(
+                probe,
+                failure_threshold=get_setting('circuit_breaker_failures', 3),
+                on_change=lambda breaker: sublime.set_timeout(show_server_status, 0))
+        return _circuit_breakers[url]
+
+def show_server_status():
+    """ shows in every view's status bar which servers are not responding """
+    with _connection_pools_lock:
+        breakers = sorted(_circuit_breakers.items())
+    messages = []
+    for url, breaker in breakers:
+        seconds = breaker.seconds_until_retry()
+        if not breaker.allow() and seconds is not None:
+            messages.append('Urtext server %s not responding, retrying in %ds' % (url, seconds + 1))
+    for window in sublime.windows():
+        for view in window.views():
+            if messages:
+                view.set_status('urtext_server', '; '.join(messages))
+            else:
+                view.erase_status('urtext_server')
+
+def connection_report():
+    with _connection_pools_lock:
+        pools = sorted(_connection_pools.items())
+    return '\n\n'.join(url + '\n' + pool.report() for url, pool in pools)
+
+def urtext_get(endpoint, values={}, compress=False, url=None):
+    data = urllib.parse.urlencode(values).encode('ascii')
+    headers = {'Content-Type' : 'application/x-www-form-urlencoded'}
+    if compress:
+        data = gzip.compress(data)
+        headers['Content-Encoding'] = 'gzip'
+    # large responses can be asked for compressed or as MessagePack
+    response_formats = dict(DEFAULT_RESPONSE_FORMATS)
+    response_formats.update(get_setting('response_formats', {}) or {})
+    response_format = response_formats.get(endpoint, 'json')
+    headers.update(request_headers(response_format))
+    url = url or server_for(values)
+    breaker = get_circuit_breaker(url)
+    if not breaker.allow():
+        raise ServerUnavailableError('Urtext server %s is not responding' % url)
+    caller = find_caller()
+    start = time.time()
+    try:
+        status, response_headers, response = get_connection_pool(url).request(
+            'POST', 
+            '/' + endpoint, 
+            body=data,
+            headers=headers,
+            timeout=request_timeout(endpoint))
+    except Exception as e:
+        record_request(endpoint, start, len(data), 0, caller, error=True)
+        if is_server_failure(endpoint, e):
+            breaker.record_failure()
+        raise
+    breaker.record_success()
+    record_request(endpoint, start, len(data), len(response), caller, error=status >= 400)
+    result = decode_response(response_headers, response) if status < 400 else None
+    recording_path = get_setting('record_requests_path')
+    if recording_path:
+        request_recorder.record(
+            recording_path, endpoint, values, status, result, time.time() - start)
+    if status >= 400:
+        raise urllib.error.HTTPError(
+            url + endpoint, status, response.decode('utf-8', 'replace'), dict(response_headers), None)
+    return result
+
+def urtext_stream(endpoint, values={}, url=None, use_circuit_breaker=True):
+    """ 
+    like urtext_get(), but returns an iterator over the lines
+    of the response as the server sends them. Streams that retry by
+    themselves can bypass the server's circuit breaker.
+    """
+    data = urllib.parse.urlencode(values).encode('ascii')
+    url = url or server_for(values)
+    breaker = get_circuit_breaker(url) if use_circuit_breaker else None
+    if breaker and not breaker.allow():
+        raise ServerUnavailableError('Urtext server %s is not responding' % url)
+    caller = find_caller()
+    start = time.time()
     try:
-        data = urllib.parse.urlencode(values)
-    except URLError:
-        ('No Urtext project serving')
-        return {'':''}
-    data = data.encode('ascii') 
-    r = urllib.request.urlopen(URL + endpoint, data)
-    response = r.read().decode('utf-8')
-    return json.loads(response)
+        status, headers, lines = get_connection_pool(url).open_stream(
+            'POST', 
+            '/' + endpoint, 
+            body=data,
+            headers={'Content-Type' : 'application/x-www-form-urlencoded'},
+            timeout=request_timeout(endpoint))
+    except Exception as e:
+        record_request(endpoint, start, len(data), 0, caller, error=True)
+        if breaker and is_server_failure(endpoint, e):
+            breaker.record_failure()
+        raise
+    if breaker:
+        breaker.record_success()
+    # streamed responses are timed to their headers; their size is not known yet
+    record_request(endpoint, start, len(data), 0, caller, error=status >= 400)
+    if status >= 400:
+        response = b''.join(lines)
+        raise urllib.error.HTTPError(
+            url + endpoint, status, response.decode('utf-8', 'replace'), dict(headers), None)
+    return lines
+
+def record_request(endpoint, start, request_bytes, response_bytes, caller, error=False):
+    seconds = time.time() - start
+    request_stats.record(endpoint, seconds, request_bytes, response_bytes, caller, error=error)
+    threshold = get_setting('slow_call_log_ms', 0)
+    if threshold and seconds * 1000 >= threshold:
+        print('Urtext: slow call to %s took %.0f ms (%s)' % (endpoint, seconds * 1000, caller))
+
+def urtext_get_optional(endpoint, values={}, stream=False, compress=False, url=None):
+    """ 
+    like urtext_get() (or urtext_stream()), but returns None if the server 
+    does not provide the endpoint, and remembers that so that server
+    is not asked again.
+    """
+    url = url or server_for(values)
+    key = (url, endpoint)
+    if key in _unsupported_endpoints:
+        return None
+    try:
+        if stream:
+            return urtext_stream(endpoint, values, url=url)
+        return urtext_get(endpoint, values, compress=compress, url=url)
+    except urllib.error.HTTPError as e:
+        if e.code not in [404, 405]:
+            raise
+        _unsupported_endpoints.add(key)
+        return None
+
+def urtext_get_async(endpoint, values={}, callback=None, errback=None, url=None):
+    """ 
+    runs urtext_get() on the worker pool and returns a Future;
+    callback receives the response on the main thread.
+    """
+    return run_in_background(
+        lambda: urtext_get(endpoint, values, url=url), 
+        callback=callback, 
+        errback=errback)
+
+def watch_server(url):
+    """ 
+    listens to the server's 'events' stream, if it has one, so changes 
+    made by the server are seen without asking for them.
+    """
+    if not get_setting('server_events', True) or url in _event_streams:
+        return
+    _event_streams[url] = EventStream(
+        lambda last_id: open_event_stream(url, last_id),
+        lambda event, data: sublime.set_timeout(
+            lambda: handle_server_event(event, data), 0)).start()
+
+def open_event_stream(url, last_id):
+    values = {} if last_id is None else {'last_event_id' : last_id}
+    try:
+        # EventStream backs off by itself; its failures should not 
+        # cut the server off from user requests
+        return urtext_stream('events', values, url=url, use_circuit_breaker=False)
+    except urllib.error.HTTPError as e:
+        if e.code in [404, 405]:
+            return None
+        raise
+
+def handle_server_event(event, data):
+    """
+    'file-changed' reverts open views of the file, unless they have 
+    unsaved changes; 'file-renamed' retargets them; 'revision' marks
+    a project's cached nodes and link targets stale if it moved on.
+    """
+    if event in ['connected', 'disconnected']:
+        # events may have been missed, so nothing pushed can be relied on
+        _pushed_revisions.clear()
+        return
+    if event == 'revision':
+        project_changed(data['project'], data['revision'])
+        return
+    if event == 'file-changed':
+        filename = data['filename']
+        _node_range_indexes.pop(filename, None)
+        revert_open_views(filename)
+    elif event == 'file-renamed':
+        filename = data['old_filename']
+        _node_range_indexes.pop(filename, None)
+        _snapshot_bases.pop(filename, None)
+        for view in open_views(filename):
+            retarget_view(view, data['new_filename'])
+    else:
+        return
+    if 'revision' in data:
+        project_changed(data.get('project', os.path.dirname(filename)), data['revision'])
+
+def project_changed(project, revision):
+    # cached nodes catch up with 'nodes-since' when next used
+    _pushed_revisions[project] = revision
+    if link_targets.revision(project) != revision:
+        link_targets.invalidate(project, revision)
+    if _keyphrase_nodes.revision(project) != revision:
+        _keyphrase_nodes.invalidate(project, revision)
+
+def pushed_revision(project):
+    """ the project's revision as last announced by its server, or None """
+    return _pushed_revisions.get(project)
+
+def open_views(filename, window=None):
+    return view_registry.open_views(filename, window)
+
+def retarget_view(view, filename):
+    view.retarget(filename)
+    view_registry.add(view)
+
+def plugin_loaded():
+    for window in sublime.windows():
+        for view in window.views():
+            view_registry.add(view)
+
+class UrtextViewRegistryListener(EventListener):
+    """ keeps view_registry current as files are opened, cloned, saved as, moved and closed """
+    def on_load(self, view):
+        view_registry.add(view)
+
+    def on_clone(self, view):
+        view_registry.add(view)
+
+    def on_post_save(self, view):
+        # a Save As gives the view a new filename
+        view_registry.add(view)
+
+    def on_post_move(self, view):
+        # Sublime Text 4 only
+        view_registry.add(view)
+
+    def on_activated(self, view):
+        # also catches views opened without an on_load, e.g. a file already loaded elsewhere
+        view_registry.add(view)
+
+    def on_close(self, view):
+        view_registry.remove(view)
 
 class UrtextTextCommand(sublime_plugin.TextCommand):
     def __init__(self, view):
@@ -48,13 +401,32 @@ class UrtextTextCommand(sublime_plugin.TextCommand):
 class ListProjectsCommand(sublime_plugin.TextCommand):
     
     def run(self, view):
-        self.r = urtext_get('projects')
+        run_in_background(self.list_projects, callback=self.show_projects)
+    def list_projects(self):
+        """ (title, server) for the projects of every known server """
+        projects = []
+        for url in known_servers():
+            try:
+                r = urtext_get('projects', url=url)
+            except Exception:
+                if url == server_url():
+                    raise
+                print('Urtext: could not list projects on %s' % url)
+                continue
+            projects.extend((title, url) for title in r['projects'])
+        return projects
+    def show_projects(self, projects):
+        self.projects = projects
         show_panel(
             self.view.window(), 
-            [t for t in self.r['projects']],
+            [t for t, url in self.projects],
             self.set_window_project)
     def set_window_project(self, selection):
-        s = urtext_get('set-project',{ 'title' : self.r['projects'][selection]})
+        title, url = self.projects[selection]
+        run_in_background(
+            lambda: urtext_get('set-project', { 'title' : title }, url=url),
+            callback=self.open_project)
+    def open_project(self, s):
         self.view.set_status('urtext_project', 'Urtext Project: '+s['title'])
         _SublimeUrtextWindows[self.view.window().id()] = s['path']
         node_id = s['nav_current']
@@ -63,19 +435,22 @@ class ListProjectsCommand(sublime_plugin.TextCommand):
 class MoveFileToAnotherProjectCommand(UrtextTextCommand):
     
     def run(self, view):
-        r = urtext_get('projects', {'project':get_path(self.view)})
-        show_panel(self.window, r['projects'], self.move_file)
+        urtext_get_async('projects', 
+            {'project':get_path(self.view)},
+            callback=lambda r: show_panel(self.window, r['projects'], self.move_file))
     def move_file(self, new_project_title):
                 
         replace_links = sublime.yes_no_cancel_dialog(
             'Do you want to also rewrite links to nodes in this file as links to the new project?')
         replace_links = True if replace_links == sublime.DIALOG_YES else False
         filename = self.view.file_name()
-        s = urtext_get('move-file', {
+        urtext_get_async('move-file', {
             'filename' : filename, 
             'new_project':new_project_title, 
             'replace_links' : str(replace_links)
-            })
+            },
+            callback=self.file_moved)
+    def file_moved(self, s):
         self.view.window().run_command('close_file')
         last_node = s['last_node']
         if last_node:
@@ -88,26 +463,37 @@ class MoveFileToAnotherProjectCommand(UrtextTextCommand):
 class UrtextHomeCommand(sublime_plugin.TextCommand):
     
     def run(self, view):
-        s = urtext_get('home', {'project':get_path(self.view)})
+        urtext_get_async('home', 
+            {'project':get_path(self.view)}, 
+            callback=self.go_home)
+    def go_home(self, s):
         if 'filename' in s:
             open_urtext_node(self.view, s['filename'], s['nav_current'], s['position'])
 class NavigateBackwardCommand(sublime_plugin.TextCommand):
     def run(self, view):
-        s = urtext_get('nav-back' , {'project':get_path(self.view)})
+        urtext_get_async('nav-back' , 
+            {'project':get_path(self.view)}, 
+            callback=self.navigate)
+    def navigate(self, s):
         if s['nav_current'] != 'NONE':
             open_urtext_node(self.view, s['filename'], s['nav_current'], s['position'])
-class NavigateForwardCommand(sublime_plugin.TextCommand):
+class NavigateForwardCommand(NavigateBackwardCommand):
     def run(self, view):
-        s = urtext_get('nav-forward', {'project':get_path(self.view)})
-        if s['nav_current'] != 'NONE':
-            open_urtext_node(self.view, s['filename'], s['nav_current'], s['position'])
+        urtext_get_async('nav-forward', 
+            {'project':get_path(self.view)}, 
+            callback=self.navigate)
 
 class OpenUrtextLinkCommand(sublime_plugin.TextCommand):
     def run(self, view):
         position = self.view.sel()[0].a
         column = self.view.rowcol(position)[1]
         full_line = self.view.substr(self.view.line(self.view.sel()[0]))
-        s = urtext_get('get-link-set-project', {'line' : full_line, 'column' : column})
+        urtext_get_async('get-link-set-project', 
+            {'line' : full_line, 'column' : column}, 
+            callback=self.open_link,
+            url=view_server(self.view))
+
+    def open_link(self, s):
         kind = s['link_kind']
         if kind == 'EDITOR_LINK':
             file_view = self.view.window().open_file(s['link'])
@@ -116,30 +502,22 @@ class OpenUrtextLinkCommand(sublime_plugin.TextCommand):
         if kind == 'HTTP':
             success = webbrowser.get().open(s['link'])
             if not success:
-                self.log('Could not open tab using your "web_browser_path" setting')       
+                print('Could not open tab using your "web_browser_path" setting')       
         if kind == 'FILE':
             open_external_file(s['link'])
 
 
-class MouseOpenUrtextLinkCommand(sublime_plugin.TextCommand):
+class MouseOpenUrtextLinkCommand(OpenUrtextLinkCommand):
     def run(self, edit, **kwargs):
         
         click_position = self.view.window_to_text((kwargs['event']['x'],kwargs['event']['y']))
         region = self.view.full_line(click_position)
         full_line = self.view.substr(region)
         row, col = self.view.rowcol(click_position)
-        s = urtext_get('get-link-set-project', {'line' : full_line, 'column' : col})
-        kind = s['link_kind']
-        if kind == 'EDITOR_LINK':
-            file_view = self.view.window().open_file(s['link'])
-        if kind == 'NODE':
-            open_urtext_node(self.view, s['filename'], s['nav_current'], position=s['position'])
-        if kind == 'HTTP':
-            success = webbrowser.get().open(s['link'])
-            if not success:
-                self.log('Could not open tab using your "web_browser_path" setting')       
-        if kind == 'FILE':
-            open_external_file(s['link'])
+        urtext_get_async('get-link-set-project', 
+            {'line' : full_line, 'column' : col},
+            callback=self.open_link,
+            url=view_server(self.view))
 
     def want_event(self):
         return True
@@ -160,14 +538,49 @@ class MouseOpenUrtextLinkCommand(sublime_plugin.TextCommand):
 
 def take_snapshot(view):
     if view and view.file_name():
-        filename = os.path.basename(view.file_name())
-        s = urtext_get('snapshot', {
-            'project': os.path.dirname(view.file_name()),
-            'filename':view.file_name(), 
-            'contents':get_contents(view)})
+        filename = view.file_name()
+        contents = get_contents(view)
+        s = send_snapshot_diff(filename, contents)
+        if s is None:
+            s = urtext_get('snapshot', {
+                'project': os.path.dirname(filename),
+                'filename':filename, 
+                'contents':contents})
+        if s['success']:
+            # only now does the history listing of this file include it
+            _history_revisions[filename] = _history_revisions.get(filename, 0) + 1
         return s['success']
     return False  
 
+def send_snapshot_diff(filename, contents):
+    """
+    Sends only the line diff against the last snapshot the server
+    acknowledged for this file, gzip-compressed, with hashes of both
+    versions so the server can check it applied cleanly; if it did not,
+    the whole file is sent. Returns None if the server has no 
+    'snapshot-diff' endpoint.
+    """
+    values = {
+        'project': os.path.dirname(filename),
+        'filename': filename,
+        'hash': hashlib.sha1(contents.encode('utf-8')).hexdigest(),
+        }
+    base = _snapshot_bases.get(filename)
+    if base is not None:
+        diff_values = dict(values)
+        diff_values['base_hash'] = hashlib.sha1(base.encode('utf-8')).hexdigest()
+        diff_values['diff'] = json.dumps(line_diff(base, contents))
+        s = urtext_get_optional('snapshot-diff', diff_values, compress=True)
+        if s is None or s['success']:
+            if s is not None:
+                _snapshot_bases.set(filename, contents)
+            return s
+    values['contents'] = contents
+    s = urtext_get_optional('snapshot-diff', values, compress=True)
+    if s is not None and s['success']:
+        _snapshot_bases.set(filename, contents)
+    return s
+
 class ToggleHistoryTraverse(UrtextTextCommand):
     """ Toggles history traversing on/off """
     def run(self, edit):
@@ -211,8 +624,17 @@ class TraverseHistoryView(EventListener):
     def __init__(self):
         self.current_file = None
         self.history = None
+        self.handle = None
+        self.timestamps = None
         self.string_timestamps = None
+        self.timestamp_index = {}
+        self.listing_key = None
+        self.selection_generation = 0
+        self.selected_state = None
         self.rewriting = False
+        # reconstructed file states, keyed by (filename, timestamp), 
+        # up to about 4 million characters in all
+        self.states = LRUCache(max_size=64, max_weight=4000000, weigh=len)
     
     def on_selection_modified(self, view):
         if view.name() != 'urtext_history':
@@ -236,77 +658,280 @@ class TraverseHistoryView(EventListener):
         filename = self.file_view.file_name()
         if self.current_file != filename:
             self.current_file = filename
-        s = urtext_get('get-history', {
+        # the listing is fetched once per file and save/snapshot
+        listing_key = (filename, _history_revisions.get(filename, 0))
+        if listing_key == self.listing_key and get_contents(history_view).strip():
+            return self.select_line_later(history_view)
+        self.listing_key = listing_key
+        urtext_get_async('get-history', {
                 'project' : os.path.dirname(filename),
                 'filename' : filename,
-            })
-        
-        new_history = json.loads(s['history'])
-        if not new_history:
+            },
+            callback=lambda s: self.update_history(s, history_view, filename))
+
+    def update_history(self, s, history_view, filename):
+        # servers that keep the history behind a handle send only its timestamps
+        self.handle = s.get('handle')
+        if self.handle:
+            new_history = None
+            timestamps = sorted(s['timestamps'], reverse=True)
+        else:
+            new_history = json.loads(s['history'])
+            timestamps = sorted(new_history.keys(), reverse=True)
+        if not timestamps:
             return None
         ts_format =  s['timestamp-format']
-        string_timestamps = [datetime.datetime.fromtimestamp(int(i)).strftime(ts_format) for i in sorted(new_history.keys(),reverse=True)]
+        string_timestamps = [datetime.datetime.fromtimestamp(int(i)).strftime(ts_format) for i in timestamps]
         if string_timestamps != self.string_timestamps or not get_contents(history_view).strip():
             self.string_timestamps = string_timestamps
+            self.timestamp_index = dict((t, i) for i, t in enumerate(string_timestamps))
+            self.timestamps = timestamps
             self.history = new_history
             self.rewriting = True
             history_view.set_read_only(False)
-            history_view.run_command("select_all")
-            history_view.run_command("right_delete")
-            history_view.run_command("insert_snippet", {"contents": 'HISTORY for '+ os.path.basename(filename)+'\n'})        
-            for line in self.string_timestamps:
-                history_view.run_command("insert_snippet", {"contents": line+'\n'})
+            listing = 'HISTORY for '+ os.path.basename(filename)+'\n'
+            listing += ''.join(line+'\n' for line in self.string_timestamps)
+            history_view.run_command("urtext_replace_contents", {"text": listing})
             self.rewriting = False
             history_view.set_read_only(True)
             history_view.sel().clear()
             history_view.sel().add(sublime.Region(0,0))
             history_view.set_viewport_position((0,0))
             return
-        line = view.substr(history_view.line(history_view.sel()[0]))
-        if line in self.string_timestamps:             
-            index = self.string_timestamps.index(line) 
+        self.select_line_later(history_view)
+
+    def select_line_later(self, history_view):
+        """ shows the state on the selected line once the cursor settles """
+        self.selection_generation += 1
+        generation = self.selection_generation
+        sublime.set_timeout(lambda: self.select_line(history_view, generation), 30)
+
+    def select_line(self, history_view, generation):
+        if generation != self.selection_generation or not history_view.window():
+            return
+        line = history_view.substr(history_view.line(history_view.sel()[0]))
+        index = self.timestamp_index.get(line)
+        if index is not None:
             self.show_state(index)
     
     def show_state(self, index):
-
-        s = urtext_get('apply-patches', {
-            'history' : json.dumps(self.history),
+        key = (self.current_file, self.timestamps[index])
+        self.selected_state = key
+        state = self.states.get(key)
+        if state is not None:
+            return self.render_state(state)
+        values = {
             'distance-back' : index,
-            'project':get_path(self.view)
-            })
-        state = s['state']
-        self.file_view.run_command("select_all")
-        self.file_view.run_command("right_delete")
-        for line in state.split('\n'):
-            self.file_view.run_command("append", {"characters": line+ "\n" })
+            'project':get_path(self.file_view)
+            }
+        if self.handle:
+            values['handle'] = self.handle
+        else:
+            values['history'] = json.dumps(self.history)
+        urtext_get_async('apply-patches', 
+            values,
+            callback=lambda s: self.state_received(key, s['state']))
+
+    def state_received(self, key, state):
+        self.states.set(key, state)
+        # drop states the user has already scrolled past
+        if key == self.selected_state:
+            self.render_state(state)
+
+    def render_state(self, state):
+        self.file_view.run_command("urtext_replace_contents", {
+            "text": state, 
+            "diff": True })
+
+class PagedQueryCommand(UrtextTextCommand):
+    """
+    Browses a list too long to send whole, a page at a time. As the 
+    user types into an input panel, the server is asked for the page 
+    of items that best match, which is listed in an output panel; 
+    confirming shows it in a quick panel whose last item loads the 
+    next page. Subclasses provide query_page(query, offset), returning 
+    (items, more) or None if the server cannot be queried, 
+    display_item(item), returning its quick panel rows, item_chosen(item),
+    and unpaged(), which browses the old way.
+    """
+    panel_name = 'urtext_query'
+    prompt = 'filter'
+    more_caption = 'More...'
+
+    def browse(self):
+        self.query = ''
+        self.generation = 0
+        self.pending = None
+        self.items = []
+        self.has_more = False
+        run_in_background(
+            lambda: self.query_page('', 0),
+            callback=self.first_page)
+
+    def first_page(self, page):
+        if page is None:
+            return self.unpaged()
+        window = self.view.window()
+        self.panel = window.create_output_panel(self.panel_name)
+        window.run_command('show_panel', {'panel' : 'output.' + self.panel_name})
+        self.page_received('', self.generation, page)
+        window.show_input_panel(
+            self.prompt,
+            '',
+            self.choose_item,
+            self.query_changed,
+            self.close_panel
+            )
+
+    def query_changed(self, string):
+        self.generation += 1
+        generation = self.generation
+        sublime.set_timeout(
+            lambda: self.search(string, generation), 
+            get_setting('live_search_delay', 250))
+
+    def search(self, string, generation):
+        if generation != self.generation:
+            return
+        if self.pending:
+            self.pending.cancel()
+        self.pending = run_in_background(
+            lambda: self.query_page(string, 0),
+            callback=lambda page: self.page_received(string, generation, page))
+
+    def page_received(self, string, generation, page):
+        if generation != self.generation:
+            return
+        if page is None:
+            return self.query_unavailable()
+        self.query = string
+        self.items, self.has_more = page
+        self.panel.run_command('urtext_replace_contents', {
+            'text' : '\n'.join(' - '.join(rows) for rows in self.display_menu())})
+
+    def display_menu(self):
+        menu = [self.display_item(item) for item in self.items]
+        if self.has_more:
+            rows = len(menu[0]) if menu else 1
+            menu.append([self.more_caption] + [''] * (rows - 1))
+        return menu
+
+    def close_panel(self):
+        self.generation += 1
+        self.view.window().destroy_output_panel(self.panel_name)
+
+    def choose_item(self, string):
+        self.close_panel()
+        if self.items:
+            show_panel(self.view.window(), self.display_menu(), self.item_selected)
+
+    def item_selected(self, index):
+        if index < len(self.items):
+            return self.item_chosen(self.items[index])
+        run_in_background(
+            lambda: self.query_page(self.query, len(self.items)),
+            callback=self.next_page)
+
+    def query_unavailable(self):
+        """ the server stopped answering queries during the session """
+        if self.view.window():
+            self.close_panel()
+            self.view.window().run_command('hide_panel', {'cancel' : True})
+        self.unpaged()
+
+    def next_page(self, page):
+        if page is None:
+            return self.unpaged()
+        first_new = len(self.items)
+        items, self.has_more = page
+        self.items = self.items + items
+        show_panel(
+            self.view.window(), 
+            self.display_menu(), 
+            self.item_selected, 
+            selected_index=first_new)
+
+def query_nodes(project, query, offset=0):
+    """ 
+    a page of the project's nodes, ranked by how well they match 
+    query, or most recent first for no query, as {'nodes' : [...], 
+    'more' : bool}; None if the server cannot query nodes
+    """
+    values = {
+        'query' : query,
+        'offset' : offset,
+        'limit' : get_setting('node_browser_page_size', 100),
+        }
+    if project is not None:
+        # no project queries all projects
+        values['project'] = project
+    return urtext_get_optional('nodes-query', values)
+
+class NodeBrowserCommand(PagedQueryCommand):
+    """
+    Browses the project's nodes a page at a time with 'nodes-query',
+    so the full node list is never held at once; servers without it 
+    send every node, as does show_menu() for the subclasses that 
+    browse a given list.
+    """
+    panel_name = 'urtext_node_browser'
+    prompt = 'node'
+    more_caption = 'More nodes...'
 
-class NodeBrowserCommand(sublime_plugin.TextCommand):
-    
     def run(self, edit):
-        self.menu = NodeBrowserMenu(project=get_path(self.view))
+        self.project = get_path(self.view)
+        self.browse()
+
+    def query_page(self, query, offset):
+        s = query_nodes(self.project, query, offset=offset)
+        if s is None:
+            return None
+        return [NodeInfo(node) for node in s['nodes']], s.get('more', False)
+
+    def display_item(self, item):
+        return [item.title, item.project_title + ' - ' + item.date]
+
+    def item_chosen(self, item):
+        self.open_node(item)
+
+    def unpaged(self):
+        self.show_menu(project=self.project)
+
+    def show_menu(self, project='', nodes=''):
+        run_in_background(
+            lambda: NodeBrowserMenu(project=project, nodes=nodes),
+            callback=self.menu_ready)
+
+    def menu_ready(self, menu):
+        self.menu = menu
         show_panel(
             self.view.window(), 
             self.menu.display_menu, 
             self.open_the_file)
 
     def open_the_file(self, selected_option):        
-        selected_item = self.menu.full_menu[selected_option]
-        s = urtext_get('set-project', { 'title' : selected_item.project_title })
-        s = urtext_get('nav', {'node' : selected_item.node_id })
+        self.open_node(self.menu.full_menu[selected_option])
+
+    def open_node(self, selected_item):
+        url = server_for({'filename' : selected_item.filename})
+        def set_project_and_nav():
+            urtext_get('set-project', { 'title' : selected_item.project_title }, url=url)
+            urtext_get('nav', {'node' : selected_item.node_id }, url=url)
+        run_in_background(set_project_and_nav)
         open_urtext_node(
             self.view, 
             selected_item.filename, 
             selected_item.node_id, 
-            position=selected_item.position)
+            position=int(selected_item.position))
 
-def show_panel(window, menu, main_callback):
+def show_panel(window, menu, main_callback, selected_index=-1):
     """ shows a quick panel with an option to cancel if -1 """
     def private_callback(index):
         if index == -1:
             return
         # otherwise return the main callback with the index of the selected item
         return main_callback(index)
-    window.show_quick_panel(menu, private_callback)
+    window.show_quick_panel(menu, private_callback, 0, selected_index)
 
 class NodeBrowserMenu:
     """ custom class to store more information on menu items than is displayed """
@@ -320,41 +945,38 @@ class NodeBrowserMenu:
 #TODO fix, returns all nodes
 class BacklinksBrowser(NodeBrowserCommand):
     def run(self, view):
-        node_id = get_node_id(self.view)
-        s = urtext_get('backlinks',{'id' : node_id})
-        backlinks = s['backlinks']
-        if backlinks:
-            self.menu = NodeBrowserMenu(
-                project=current_project,
-                nodes=backlinks)
-            show_panel(
-                self.view.window(), 
-                self.menu.display_menu, 
-                self.open_the_file)
+        def get_backlinks():
+            node_id = get_node_id(self.view)
+            s = urtext_get('backlinks',{'id' : node_id}, url=view_server(self.view))
+            backlinks = s['backlinks']
+            if backlinks:
+                return NodeBrowserMenu(
+                    project=get_path(self.view),
+                    nodes=backlinks)
+        run_in_background(get_backlinks, callback=self.menu_ready)
+
+    def menu_ready(self, menu):
+        if menu:
+            NodeBrowserCommand.menu_ready(self, menu)
 
 #TODO fix, returns all nodes
 class ForwardlinksBrowser(NodeBrowserCommand):
     def run(self, view):
-        node_id = get_node_id(self.view)
-        s = urtext_get('forward-links',{'id' : node_id})
-        forward_links = s['forward-links']
-        self.menu = NodeBrowserMenu(
-            project=current_project,
-            nodes=forward_links,
-            )
-        show_panel(
-            self.view.window(), 
-            self.menu.display_menu, 
-            self.open_the_file)
+        def get_forward_links():
+            node_id = get_node_id(self.view)
+            s = urtext_get('forward-links',{'id' : node_id}, url=view_server(self.view))
+            forward_links = s['forward-links']
+            return NodeBrowserMenu(
+                project=get_path(self.view),
+                nodes=forward_links,
+                )
+        run_in_background(get_forward_links, callback=self.menu_ready)
 
 class AllProjectsNodeBrowser(NodeBrowserCommand):
     
     def run(self, view):
-        self.menu = NodeBrowserMenu(project=None)
-        show_panel(
-            self.view.window(), 
-            self.menu.display_menu, 
-            self.open_the_file)
+        self.project = None
+        self.browse()
 #REWRITE
 class FullTextSearchCommand(UrtextTextCommand):
     def run(self, view):
@@ -367,16 +989,171 @@ class FullTextSearchCommand(UrtextTextCommand):
             )
     
     def show_results(self, string):
-        s = urtext_get('search', {'string':string})
-        
-        self.results_view = self.window.new_file()
-        self.results_view.set_scratch(True)
-        self.results_view.set_syntax_file('sublime_urtext.sublime-syntax')
-        while self.results_view.is_loading():
-            time.sleep(0.1)
-        final_results = s['results']            
-        for item in final_results:
-            self.results_view.run_command("append", {"characters": item +'\n'})
+        results_view = self.window.new_file()
+        results_view.set_scratch(True)
+        results_view.set_syntax_file('sublime_urtext.sublime-syntax')
+        cancelled = threading.Event()
+        _active_searches[cancelled] = None
+        url = view_server(self.view)
+        run_in_background(
+            lambda: self.stream_results(string, cancelled, url, results_view))
+
+    def stream_results(self, string, cancelled, url, results_view):
+        """
+        Reads results from 'search-stream' (one JSON string per line) as 
+        the server finds them and appends them to the results view in 
+        batches. Falls back to the complete 'search' response.
+        """
+        limit = get_setting('search_result_limit', 1000)
+        lines = urtext_get_optional('search-stream', {'string':string}, stream=True, url=url)
+        if lines is None:
+            results = iter(urtext_get('search', {'string':string}, url=url)['results'])
+        else:
+            _active_searches[cancelled] = lines
+            if cancelled.is_set():
+                # cancelled while the stream was opening
+                lines.abort()
+            results = (json.loads(line.decode('utf-8')) for line in lines if line.strip())
+        batch = []
+        count = 0
+        last_flush = time.time()
+        status = None
+        try:
+            for item in results:
+                if cancelled.is_set():
+                    status = 'cancelled'
+                    break
+                batch.append(item + '\n')
+                count += 1
+                if count >= limit:
+                    status = 'limit reached'
+                    break
+                if len(batch) >= 50 or time.time() - last_flush > 0.1:
+                    self.append_results(results_view, batch)
+                    batch = []
+                    last_flush = time.time()
+        except (OSError, http.client.HTTPException):
+            # an aborted stream ends its read with an error
+            if not cancelled.is_set():
+                raise
+        finally:
+            if lines is not None:
+                lines.close()
+            _active_searches.pop(cancelled, None)
+        if cancelled.is_set():
+            status = 'cancelled'
+        self.append_results(results_view, batch)
+        status = '%d results' % count + (' (' + status + ')' if status else '')
+        sublime.set_timeout(
+            lambda: results_view.set_status('urtext_search', 'Search: ' + status), 0)
+
+    def append_results(self, results_view, batch):
+        if batch:
+            text = ''.join(batch)
+            sublime.set_timeout(
+                lambda: results_view.run_command("append", {"characters": text}), 0)
+
+class CancelSearchCommand(sublime_plugin.TextCommand):
+    """ 
+    stops all full text searches still streaming results, at once
+    even if they are waiting for the server's next result
+    """
+    def run(self, edit):
+        for cancelled, lines in list(_active_searches.items()):
+            cancelled.set()
+            if lines is not None:
+                lines.abort()
+
+class LiveSearchCommand(UrtextTextCommand):
+    """
+    Searches as the user types, showing results in an output panel.
+    Keystrokes are debounced, and each query carries a generation number
+    so answers to outdated queries are dropped. A query that narrows a
+    recent one is filtered locally from that query's complete results,
+    keeping those that contain every search term.
+    """
+    def run(self, edit):
+        self.generation = 0
+        self.pending = None
+        self.results = []
+        self.prefix_results = LRUCache(max_size=16)
+        window = self.view.window()
+        self.panel = window.create_output_panel('urtext_live_search')
+        window.run_command('show_panel', {'panel' : 'output.urtext_live_search'})
+        window.show_input_panel(
+            'search terms',
+            '',
+            self.choose_result,
+            self.query_changed,
+            self.close_panel
+            )
+
+    def query_changed(self, string):
+        self.generation += 1
+        generation = self.generation
+        sublime.set_timeout(
+            lambda: self.search(string, generation), 
+            get_setting('live_search_delay', 250))
+
+    def search(self, string, generation):
+        if generation != self.generation:
+            return
+        if len(string.strip()) < get_setting('live_search_min_length', 2):
+            return self.show_live_results([])
+        results = self.filter_cached(string)
+        if results is not None:
+            return self.show_live_results(results)
+        if self.pending:
+            # a request still waiting for a worker is not sent at all
+            self.pending.cancel()
+        self.pending = urtext_get_async('search', 
+            {'string':string},
+            callback=lambda s: self.results_received(string, generation, s['results']),
+            url=view_server(self.view))
+
+    def results_received(self, string, generation, results):
+        self.prefix_results.set(string, results)
+        if generation == self.generation:
+            self.show_live_results(results)
+
+    def filter_cached(self, string):
+        terms = string.lower().split()
+        for length in range(len(string), 0, -1):
+            results = self.prefix_results.get(string[:length])
+            if results is not None:
+                return [r for r in results if all(t in r.lower() for t in terms)]
+        return None
+
+    def show_live_results(self, results):
+        self.results = results[:get_setting('search_result_limit', 1000)]
+        self.panel.run_command('urtext_replace_contents', {'text' : '\n'.join(self.results)})
+
+    def close_panel(self):
+        self.generation += 1
+        self.view.window().destroy_output_panel('urtext_live_search')
+
+    def choose_result(self, string):
+        self.close_panel()
+        if self.results:
+            show_panel(self.view.window(), self.results, self.open_result)
+
+    def open_result(self, index):
+        links = re.findall('>' + node_id_regex, self.results[index])
+        if not links:
+            return
+        project = get_path(self.view)
+        def resolve_first_link():
+            for node_id, target in resolve_links(
+                    [link[1:] for link in links], 
+                    first_only=True, 
+                    project=project).items():
+                if target:
+                    return node_id, target
+        def open_target(resolved):
+            if resolved:
+                node_id, (filename, position) = resolved
+                open_urtext_node(self.view, filename, node_id, position=position)
+        run_in_background(resolve_first_link, callback=open_target)
 
 def size_to_groups(groups, view):
     panel_size = 1 / groups
@@ -401,25 +1178,61 @@ class InsertNodeSingleLineCommand(sublime_plugin.TextCommand):
         add_inline_node(self.view)    
 
 def add_inline_node(view, 
-    locate_inside=True):
+    locate_inside=True,
+    callback=None):
        
     region = view.sel()[0]
     selection = view.substr(region)
-    s = urtext_get('add-inline-node', {
-        'contents': selection, 'project':get_path(view) })
-    
-    view.run_command("insert_snippet", {"contents": s['contents']})  # (whitespace)
-    if locate_inside:
-        view.sel().clear()
-        new_cursor_position = sublime.Region(region.a + 3, region.a + 3 ) 
-        view.sel().add(new_cursor_position) 
-    return s['id']
+    change_count = view.change_count()
+    def insert_node(s):
+        if view.change_count() != change_count:
+            print('Urtext: the file changed while adding the node; not inserted')
+            return
+        view.run_command("insert_snippet", {"contents": s['contents']})  # (whitespace)
+        if locate_inside:
+            view.sel().clear()
+            new_cursor_position = sublime.Region(region.a + 3, region.a + 3 ) 
+            view.sel().add(new_cursor_position) 
+        if callback:
+            callback(s['id'])
+    return urtext_get_async('add-inline-node', {
+        'contents': selection, 'project':get_path(view) },
+        callback=insert_node)
 
 class RenameFileCommand(UrtextTextCommand):
     def run(self, view):
         old_filename = self.view.file_name()
-        s = urtext_get('rename-file', { 'old_filename' : old_filename})
-        self.view.retarget(s['new-filename'])
+        urtext_get_async('rename-file', 
+            { 'old_filename' : old_filename},
+            callback=lambda s: retarget_view(self.view, s['new-filename']),
+            url=view_server(self.view))
+
+class UrtextReplaceRegionCommand(sublime_plugin.TextCommand):
+    """ 
+    replaces a region with text in a single edit, so callbacks
+    running after a command has returned can still modify the buffer.
+    """
+    def run(self, edit, start=0, end=0, text=''):
+        self.view.replace(edit, sublime.Region(start, end), text)
+
+class UrtextReplaceContentsCommand(sublime_plugin.TextCommand):
+    """ 
+    replaces the whole buffer in a single edit (one undo step). With diff, 
+    only the lines that differ from the current contents are rewritten.
+    """
+    def run(self, edit, text='', diff=False):
+        if not diff:
+            self.view.replace(edit, sublime.Region(0, self.view.size()), text)
+            return
+        contents = get_contents(self.view)
+        offsets = [0]
+        for line in contents.splitlines(True):
+            offsets.append(offsets[-1] + len(line))
+        # apply from the end so earlier offsets stay valid
+        for start, end, replacement in reversed(line_diff(contents, text)):
+            self.view.replace(edit, 
+                sublime.Region(offsets[start], offsets[end]), 
+                replacement)
 
 class NodeInfo():
     def __init__(self, node): 
@@ -430,10 +1243,109 @@ class NodeInfo():
         self.node_id = node['id']
         self.project_title = node['project_title']
 
+class NodeCache:
+    """ 
+    Node metadata per project, tagged with the server revision it was
+    fetched at. A cached project is brought up to date with the nodes 
+    changed since that revision ('nodes-since'), or, against servers 
+    without deltas, reused while the cheap 'revision' call reports no 
+    change. The full 'nodes' list is downloaded only when neither works.
+    """
+    def __init__(self):
+        self.projects = {}
+        self.lock = threading.Lock()
+
+    def get_nodes(self, project):
+        revision = self.revision(project)
+        if revision is not None and revision == pushed_revision(project):
+            # the server would have announced any change
+            return self.cached_nodes(project)
+        if revision is not None:
+            nodes = self._refresh(project, revision)
+            if nodes is not None:
+                return nodes
+        s = urtext_get_optional('revision', {'project' : project})
+        revision = s['revision'] if s is not None else None
+        s = urtext_get('nodes', { 'project' : project})
+        revision = s.get('revision', revision)
+        nodes = OrderedDict()
+        for node in s['nodes']:
+            node = NodeInfo(node)
+            nodes[(node.project_title, node.node_id)] = node
+        if revision is not None:
+            with self.lock:
+                self.projects[project] = {
+                    'revision' : revision,
+                    'nodes' : nodes,
+                    }
+        return list(nodes.values())
+
+    def revision(self, project):
+        with self.lock:
+            entry = self.projects.get(project)
+            return entry['revision'] if entry else None
+
+    def cached_nodes(self, project):
+        with self.lock:
+            entry = self.projects.get(project)
+            return list(entry['nodes'].values()) if entry else None
+
+    def _refresh(self, project, revision):
+        """ returns the up-to-date cached nodes, or None if they must be downloaded again """
+        s = urtext_get_optional('nodes-since', {
+            'project' : project, 
+            'revision' : revision,
+            })
+        if s is not None:
+            if self.apply_changes(project, revision, s):
+                return self.cached_nodes(project)
+            return None
+        s = urtext_get_optional('revision', {'project' : project})
+        if s is not None and s['revision'] == revision:
+            return self.cached_nodes(project)
+        return None
+
+    def apply_changes(self, project, revision, changes):
+        """ 
+        applies the nodes changed and removed since revision to the 
+        cached project. Returns False, dropping the project, if the cache
+        is no longer at revision or the server could not supply a delta.
+        """
+        with self.lock:
+            entry = self.projects.get(project)
+            if not entry or entry['revision'] != revision or changes.get('reset'):
+                self.projects.pop(project, None)
+                return False
+            nodes = entry['nodes']
+            for node in changes['removed']:
+                nodes.pop((node['project_title'], node['id']), None)
+            for node in changes['changed']:
+                node = NodeInfo(node)
+                key = (node.project_title, node.node_id)
+                is_new = key not in nodes
+                nodes[key] = node
+                if is_new:
+                    # new nodes are the most recent
+                    nodes.move_to_end(key, last=False)
+            entry['revision'] = changes['revision']
+        return True
+
+    def invalidate(self, project, revision=None):
+        """ 
+        drops the project's nodes unless they are already at revision;
+        the all-projects listing is always dropped.
+        """
+        with self.lock:
+            entry = self.projects.get(project)
+            if entry and (revision is None or revision != entry['revision']):
+                del self.projects[project]
+            self.projects.pop(None, None)
+
+node_cache = NodeCache()
+
 def make_node_menu(project='', nodes=''):
     if nodes == '':
-        s = urtext_get('nodes', { 'project' : project})
-        nodes = s['nodes']
+        return node_cache.get_nodes(project)
     menu = []
     for node in nodes:
         menu.append(NodeInfo(node))
@@ -454,15 +1366,20 @@ def make_display_menu(menu):
 
 class LinkToNodeCommand(UrtextTextCommand):
     def run(self, edit):
-        self.menu = NodeBrowserMenu(project=os.path.dirname(self.view.file_name()))
+        project = os.path.dirname(self.view.file_name())
+        run_in_background(
+            lambda: NodeBrowserMenu(project=project),
+            callback=self.menu_ready)
+    def menu_ready(self, menu):
+        self.menu = menu
         show_panel(self.view.window(), self.menu.display_menu, self.link_to_the_node)
     def link_to_the_node(self, selected_option):
         selected_item = self.menu.full_menu[selected_option]
-        s = urtext_get('get-link-to-node', {
+        urtext_get_async('get-link-to-node', {
                 'node_id' : selected_item.node_id,    
                 'project' : os.path.dirname(self.view.file_name())
-            })
-        self.view.run_command("insert", {"characters": s['link']})
+            },
+            callback=lambda s: self.view.run_command("insert", {"characters": s['link']}))
 
 class CopyLinkToHereCommand(UrtextTextCommand):
     """
@@ -470,34 +1387,36 @@ class CopyLinkToHereCommand(UrtextTextCommand):
     Does not include project title.
     """
     
+    include_project = False
+
     def run(self, edit):
         if not self.window:
             self.window = self.view.window()
-        s = urtext_get('get-link-to-node', {
-            'node_id' : get_node_id(self.window.active_view()),
-            'project' :  os.path.dirname(self.view.file_name()),
-            })
+        active_view = self.window.active_view()
+        project = os.path.dirname(self.view.file_name())
+        def get_link():
+            values = {
+                'node_id' : get_node_id(active_view),
+                'project' : project,
+                }
+            if self.include_project:
+                values['include_project'] = 'True'
+            return urtext_get('get-link-to-node', values)
+        run_in_background(get_link, callback=self.copy_link)
+
+    def copy_link(self, s):
         sublime.set_clipboard(s['link'])        
         self.view.show_popup(s['link'] + '\ncopied to the clipboard', 
             max_width=1800, 
             max_height=1000 
             )
-class CopyLinkToHereWithProjectCommand(UrtextTextCommand):
+class CopyLinkToHereWithProjectCommand(CopyLinkToHereCommand):
     """
     Copy a link to the node containing the cursor to the clipboard.
-    Does not include project title.
+    Includes project title.
     """
-    def run(self, edit):
-        s = urtext_get('get-link-to-node', {
-            'node_id' : get_node_id(self.window.active_view()),
-            'project' :  os.path.dirname(self.view.file_name()),
-            'include_project' : 'True'
-            })
-        sublime.set_clipboard(s['link'])        
-        self.view.show_popup(s['link'] + '\ncopied to the clipboard', 
-            max_width=1800, 
-            max_height=1000 
-            )
+    include_project = True
+
 def get_contents(view):
     if view != None:
         contents = view.substr(sublime.Region(0, view.size()))
@@ -506,18 +1425,23 @@ def get_contents(view):
 
 class NewNodeCommand(UrtextTextCommand):
     def run(self, view):
-        s = urtext_get('new-node', {'project' : get_path(self.view)})
-        new_view = self.view.window().open_file(s['filename'])
+        urtext_get_async('new-node', 
+            {'project' : get_path(self.view)},
+            callback=lambda s: self.view.window().open_file(s['filename']))
 
 class InsertLinkToNewNodeCommand(UrtextTextCommand):
     
     def run(self, view):
-        s = urtext_get('new-node',{'project' : get_path(self.view)})
-        self.view.run_command("insert", {"characters":'| >' + s['id']})
+        urtext_get_async('new-node',
+            {'project' : get_path(self.view)},
+            callback=lambda s: self.view.run_command("insert", {"characters":'| >' + s['id']}))
 
 class NewProjectCommand(UrtextTextCommand):
     def run(self, view):
-        urtext_get('new-project',{'path':get_path(self.view)})
+        urtext_get_async('new-project',
+            {'path':get_path(self.view)},
+            callback=self.project_created)
+    def project_created(self, s):
         new_view = self.window.new_file()
         new_view.set_scratch(True)
         new_view.close()
@@ -528,46 +1452,46 @@ class DeleteThisNodeCommand(UrtextTextCommand):
         if self.view.is_dirty():
             self.view.set_scratch(True)
         self.view.window().run_command('close_file')
-        urtext_get('delete-file', {'filename' : file_name})
+        urtext_get_async('delete-file', {'filename' : file_name})
 
 class InsertTimestampCommand(UrtextTextCommand):
     def run(self, edit):
-        s = urtext_get('timestamp')
-        datestamp = s['timestamp']
-        for s in self.view.sel():
-            if s.empty():
-                self.view.insert(edit, s.a, datestamp)
-            else:
-                self.view.replace(edit, s, datestamp)
+        urtext_get_async('timestamp', 
+            callback=self.insert_timestamp, 
+            url=view_server(self.view))
+    def insert_timestamp(self, s):
+        self.view.run_command('insert', {'characters' : s['timestamp']})
 
 class ConsolidateMetadataCommand(UrtextTextCommand):
     def run(self, edit):
         self.view.run_command('save')  # TODO insert notification
-        node_id = get_node_id(self.view)
-        if node_id:
-            s = urtext_get('consolidate-metadata', {
-                'node-id' : node_id,
-                'one_line' : 'True'
-                }) 
-            return True    
-        print('No Urtext node or no Urtext node with ID found here.')
-        return False
+        def consolidate():
+            node_id = get_node_id(self.view)
+            if node_id:
+                s = urtext_get('consolidate-metadata', {
+                    'node-id' : node_id,
+                    'one_line' : 'True'
+                    }, url=view_server(self.view))
+                return True    
+            print('No Urtext node or no Urtext node with ID found here.')
+            return False
+        run_in_background(consolidate)
 class InsertDynamicNodeDefinitionCommand(UrtextTextCommand):
     def run(self, edit):
-        now = datetime.datetime.now()
-        node_id = add_inline_node(
+        add_inline_node(
             self.view, 
-            locate_inside=False)
+            locate_inside=False,
+            callback=self.insert_definition)
 
+    def insert_definition(self, node_id):
         # TODO This should possibly be moved into Urtext as a utility method.
         position = self.view.sel()[0].a
         content = '\n\n[[ ID(>' + node_id + ')\n\n ]]'
-        
-        for s in self.view.sel():
-            if s.empty():
-                self.view.insert(edit, s.a, content)
-            else:
-                view.replace(edit, s, content)
+        for s in reversed(self.view.sel()):
+            self.view.run_command('urtext_replace_region', {
+                'start' : s.begin(), 
+                'end' : s.end(), 
+                'text' : content })
         self.view.sel().clear()
         new_cursor_position = sublime.Region(position + 12, position + 12) 
         self.view.sel().add(new_cursor_position) 
@@ -575,31 +1499,37 @@ class InsertDynamicNodeDefinitionCommand(UrtextTextCommand):
 class TagFromOtherNodeCommand(UrtextTextCommand):
     def run(self, edit):
         self.view.run_command('save')
-        s = urtext_get('tag-from-other', {
+        urtext_get_async('tag-from-other', {
             'line': self.view.substr(self.view.line(self.view.sel()[0])),
             'column': self.view.sel()[0].a,
-            })        
+            },
+            url=view_server(self.view))        
 class ReIndexFilesCommand(UrtextTextCommand):
     
     def run(self, edit):
-        s = urtext_get('reindex',{'project':get_path(self.view)})
+        urtext_get_async('reindex',
+            {'project':get_path(self.view)},
+            callback=self.retarget_renamed)
+    def retarget_renamed(self, s):
         renamed_files = s['renamed-files']
         print(renamed_files)
-        for view in self.view.window().views():
-            if view.file_name() == None:
-                continue
-            if view.file_name() in renamed_files:
-                view.retarget(renamed_files[view.file_name()])
+        for old_filename, new_filename in renamed_files.items():
+            for view in open_views(old_filename, self.view.window()):
+                retarget_view(view, new_filename)
 
 class AddNodeIdCommand(UrtextTextCommand):
     def run(self, edit):
-        s = urtext_get('next-id', {'project':get_path(self.view)})
-        self.view.run_command("insert_snippet",
-                              {"contents": "@" + s['node_id']})
+        urtext_get_async('next-id', 
+            {'project':get_path(self.view)},
+            callback=lambda s: self.view.run_command("insert_snippet",
+                              {"contents": "@" + s['node_id']}))
 #REWRITE
 class OpenUrtextLogCommand(UrtextTextCommand):
     def run(self, edit):
-        s = urtext_get('get-log-node',{'project':get_path(self.view)} )
+        urtext_get_async('get-log-node',
+            {'project':get_path(self.view)},
+            callback=self.open_log)
+    def open_log(self, s):
         if s['log_id'] != 'None':
             open_urtext_node(self.view, s['filename'], s['log_id'], s['position'])
             def go_to_end(view):
@@ -618,14 +1548,26 @@ class CompactNodeCommand(UrtextTextCommand):
         selection = self.view.substr(region)
         line_region = self.view.line(region) # get full line region
         line_contents = self.view.substr(line_region)
-        s = urtext_get('compact-node',{
+        change_count = self.view.change_count()
+        urtext_get_async('compact-node',{
             'filename':self.view.file_name(),
             'position': self.view.sel()[0].a,
             'project':get_path(self.view), 
             'selection' : line_contents,
-            })
+            },
+            callback=lambda s: self.insert_compact_node(s, line_region, change_count))
+
+    def insert_compact_node(self, s, line_region, change_count):
+        if self.view.change_count() != change_count:
+            # line_region no longer points at the same text
+            print('Urtext: the file changed while compacting the node; not inserted')
+            return
         if s['replace']:
-            self.view.erase(edit, line_region)
+            self.view.run_command('urtext_replace_region', {
+                'start' : line_region.a, 
+                'end' : line_region.b })
+            self.view.sel().clear()
+            self.view.sel().add(sublime.Region(line_region.a, line_region.a))
             self.view.run_command("insert_snippet",{"contents": s['contents']})
             region = self.view.sel()[0]
             self.view.sel().clear()
@@ -642,7 +1584,7 @@ class CompactNodeCommand(UrtextTextCommand):
 class PopNodeCommand(UrtextTextCommand):
     def run(self, edit):
         self.view.run_command('save')
-        s = urtext_get('pop-node', {
+        urtext_get_async('pop-node', {
             'project':get_path(self.view), 
             'filename' : self.view.file_name(),
             'position' : self.view.sel()[0].a,
@@ -652,7 +1594,7 @@ class PullNodeCommand(UrtextTextCommand):
         filename = self.view.file_name()
         position = self.view.sel()[0].a
         full_line = self.view.substr(self.view.line(self.view.sel()[0]))
-        s = urtext_get('pull-node', {
+        urtext_get_async('pull-node', {
             'project':get_path(self.view), 
             'filename' : filename,
             'position' :position,
@@ -660,13 +1602,90 @@ class PullNodeCommand(UrtextTextCommand):
             })
 class RandomNodeCommand(UrtextTextCommand):
     def run(self, edit):
-        s = urtext_get('random-node', {'project':get_path(self.view)})
-        open_urtext_node(self.view, s['filename'], s['node_id'])
+        urtext_get_async('random-node', 
+            {'project':get_path(self.view)},
+            callback=lambda s: open_urtext_node(self.view, s['filename'], s['node_id']))
+
+def query_keyphrases(project, query, offset=0):
+    """ 
+    a page of the keyphrases that fuzzy-match query, best first, as
+    {'keyphrases' : [{'keyphrase', 'count'}], 'more' : bool}, or None
+    if the server cannot query keyphrases
+    """
+    return urtext_get_optional('keyword-query', {
+        'project' : project,
+        'query' : query,
+        'offset' : offset,
+        'limit' : get_setting('keyword_page_size', 50),
+        })
+
+def get_keyphrase_nodes(project, keyphrase):
+    nodes = _keyphrase_nodes.get(project, keyphrase)
+    if nodes is None:
+        revision = _keyphrase_nodes.revision(project)
+        nodes = urtext_get('keyword-nodes', {
+            'project' : project, 
+            'keyphrase' : keyphrase,
+            })['nodes']
+        _keyphrase_nodes.set(project, keyphrase, nodes, revision)
+    return nodes
+
+class KeywordsCommand(PagedQueryCommand):
+    """
+    Browses keyphrases a page at a time with 'keyword-query'; the nodes
+    of a keyphrase are fetched only once it is chosen. Servers without
+    it send the complete keyphrase map from 'keywords' instead.
+    """
+    panel_name = 'urtext_keywords'
+    prompt = 'keyword'
+    more_caption = 'More keyphrases...'
 
-class KeywordsCommand(UrtextTextCommand):
     def run(self, edit):
+        self.project = get_path(self.view)
+        self.browse()
+
+    def query_page(self, query, offset):
+        s = query_keyphrases(self.project, query, offset=offset)
+        if s is None:
+            return None
+        return s['keyphrases'], s.get('more', False)
+
+    def display_item(self, item):
+        return ['%s (%d)' % (item['keyphrase'], item['count'])]
+
+    def item_chosen(self, item):
+        keyphrase = item['keyphrase']
+        run_in_background(
+            lambda: get_keyphrase_nodes(self.project, keyphrase),
+            callback=lambda nodes: self.show_nodes(keyphrase, nodes))
+
+    def unpaged(self):
+        urtext_get_async('keywords',  
+            {'project': self.project},
+            callback=self.show_keyphrases)
+
+    def show_nodes(self, keyphrase, nodes):
+        if len(nodes) == 1:
+            open_urtext_node(
+                self.view,
+                nodes[0]['filename'],
+                nodes[0]['id'],
+                position=nodes[0]['position'],
+                highlight=keyphrase)
+            return
+        menu = NodeBrowserMenu(project=self.project, nodes=nodes)
+        show_panel(
+            self.view.window(), 
+            menu.display_menu, 
+            lambda selection: open_urtext_node(
+                self.view, 
+                menu.full_menu[selection].filename,
+                menu.full_menu[selection].node_id,
+                position=menu.full_menu[selection].position,
+                highlight=keyphrase))
+
+    def show_keyphrases(self, s):
         window = self.view.window()
-        s = urtext_get('keywords',  {'project':get_path(self.view)})
         keyphrases = list(s['keyphrases'].keys())
         self.chosen_keyphrase = ''
         def multiple_selections(selection):
@@ -707,25 +1726,21 @@ class AssociateCommand(NodeBrowserCommand):
         position = self.view.sel()[0].a
         column = self.view.rowcol(position)[1]
         full_line = self.view.substr(self.view.line(self.view.sel()[0]))
-        s = urtext_get('associate', {
+        urtext_get_async('associate', {
             'project':get_path(self.view),
             'string' : full_line,
             'filename' : self.view.file_name(),
             'position' : self.view.sel()[0].a,
-            })
-
-        self.menu = NodeBrowserMenu(
+            },
+            callback=lambda s: self.show_menu(
                 project=get_path(self.view), 
-                nodes=s['nodes'])
-
-        show_panel(
-            self.view.window(), 
-            self.menu.display_menu, 
-            self.open_the_file)
+                nodes=s['nodes']))
        
      def open_the_file(self, selected_option):        
         selected_item = self.menu.full_menu[selected_option]
-        s = urtext_get('nav', {'node' : selected_item.node_id })
+        urtext_get_async('nav', 
+            {'node' : selected_item.node_id }, 
+            url=server_for({'filename' : selected_item.filename}))
         open_urtext_node(
             self.view, 
             selected_item.filename, 
@@ -741,6 +1756,9 @@ class ToIcs(UrtextTextCommand):
 Utility functions
 """
 
+def get_setting(key, default=None):
+    return sublime.load_settings('urtext.sublime-settings').get(key, default)
+
 def get_path(view):
     """ 
     given a view or None, establishes the current path,
@@ -814,9 +1832,14 @@ def get_path_from_window(window):
     return None
 
 def refresh_open_file(filename, view):
-    for open_file in view.window().views():
-        if open_file == filename:
-            return view.run_command('revert') # undocumented
+    """ reloads the file's open views, which the server may have rewritten """
+    sublime.set_timeout(lambda: revert_open_views(filename), 0)
+
+def revert_open_views(filename):
+    """ reloads the file's open views that have no unsaved changes """
+    for open_view in open_views(filename):
+        if not open_view.is_dirty():
+            open_view.run_command('revert') # undocumented
 
 def open_external_file(filepath):
     if sublime.platform() == "osx":
@@ -826,13 +1849,70 @@ def open_external_file(filepath):
     elif sublime.platform() == "linux":
         subprocess.Popen(('xdg-open', filepath))
 
-def get_node_id(view):
+def get_node_id(view, project=None):
     if view.file_name():
         filename = os.path.basename(view.file_name())
         position = view.sel()[0].a
-        s = urtext_get('id-from-position', { 'filename' : filename, 'position' : position})
+        project = project or get_path(view)
+        index = get_node_range_index(view, project=project)
+        if index is not None:
+            return index.node_id_at(position)
+        s = urtext_get('id-from-position', 
+            { 'filename' : filename, 'position' : position},
+            url=server_for({'project' : project}))
         return s['id']
 
+def get_node_range_index(view, project=None):
+    """ 
+    returns the NodeRangeIndex of the view's file, fetching its ranges 
+    once per buffer version, or None if the server cannot send them.
+    """
+    filename = view.file_name()
+    project = project or get_path(view)
+    change_count = view.change_count()
+    cached = _node_range_indexes.get(filename)
+    if cached and cached[0] == change_count:
+        return cached[1]
+    s = urtext_get_optional('node-ranges', 
+        {'filename' : os.path.basename(filename)},
+        url=server_for({'project' : project}))
+    if s is None:
+        return None
+    index = NodeRangeIndex(s['ranges'])
+    _node_range_indexes[filename] = (change_count, index)
+    return index
+
+def resolve_links(links, first_only=False, project=None):
+    """
+    Maps each link ID to (filename, position), or None if it does not resolve.
+    Asks for all links in one 'filenames-from-links' round trip; against
+    servers without that endpoint, falls back to one 'filename-from-link'
+    request per link. With first_only, stops at the first resolvable link.
+    Links are resolved by the server of project (the linking view's).
+    """
+    url = server_for({'project' : project})
+    links = list(OrderedDict.fromkeys(links))
+    resolved = OrderedDict()
+    s = urtext_get_optional('filenames-from-links', {
+        'links' : json.dumps(links),
+        'first_only' : str(first_only),
+        }, url=url)
+    if s is not None:
+        targets = s['targets']
+        for link in links:
+            target = targets.get(link)
+            if target and target['filename']:
+                resolved[link] = (target['filename'], target['position'])
+            else:
+                resolved[link] = None
+        return resolved
+    for link in links:
+        s = urtext_get('filename-from-link', {'link' : link}, url=url)
+        resolved[link] = (s['filename'], s['position']) if s['filename'] else None
+        if first_only and resolved[link]:
+            break
+    return resolved
+
 def highlight_phrase(view, phrase):
     regions = view.find_all(phrase, flags=sublime.IGNORECASE)
     view.add_regions(
@@ -846,20 +1926,34 @@ def highlight_phrase(view, phrase):
 
 class UrtextSaveListener(EventListener):
     def __init__(self):   
-        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)     
         self.completions = []
         self.title_completions = []
+        self.completion_index = CompletionIndex()
     
     def on_post_save(self, view):
-        self.executor.submit(self._urtext_save, view)
+        if view.file_name():
+            save_scheduler.schedule(view.file_name(), lambda: self._urtext_save(view))
 
     def _urtext_save(self, view):
         filename = view.file_name()
         if not filename:
             return
-        s = urtext_get('modified', {'filename' : filename })
+        project = os.path.dirname(filename)
+        values = {'filename' : filename }
+        cached_revision = node_cache.revision(project)
+        if cached_revision is not None:
+            values['nodes_since'] = cached_revision
+        s = urtext_get('modified', values)
+        if 'node_changes' not in s or not node_cache.apply_changes(
+                project, cached_revision, s['node_changes']):
+            node_cache.invalidate(project, s.get('revision'))
+        revision = s.get('revision', s.get('node_changes', {}).get('revision'))
+        link_targets.invalidate(project, revision)
+        _keyphrase_nodes.invalidate(project, revision)
+        _node_range_indexes.pop(filename, None)
         self.completions = s['completions']
         self.titles = s['titles']
+        self.index_completions()
         renamed_file = s['filename']
         # if renamed_file and renamed_file != filename:
         #     view.set_scratch(True) # already saved
@@ -870,14 +1964,24 @@ class UrtextSaveListener(EventListener):
         refresh_open_file(filename, view)
         take_snapshot(view)
         
-    def on_query_completions(self, view, prefix, locations):
+    def index_completions(self):
+        """ builds the prefix index once per save instead of on every keystroke """
         subl_completions = []
         for c in self.completions:
             t = c.split('::')
             if len(t) > 1:
                 subl_completions.append([t[1]+'\t'+c, c])
-        for t in self.title_completions:
-            subl_completions.append([t[0],t[1]])
+        # titles map each node title to its ID; completing one inserts a link
+        titles = self.titles.items() if isinstance(self.titles, dict) else self.titles
+        self.title_completions = [
+            [title + '\t>' + node_id, '| ' + title + ' >' + node_id] 
+            for title, node_id in titles]
+        self.completion_index = CompletionIndex(subl_completions + self.title_completions)
+
+    def on_query_completions(self, view, prefix, locations):
+        subl_completions = self.completion_index.matching(
+            prefix, 
+            limit=get_setting('completion_limit', 500))
         completions = (subl_completions, sublime.INHIBIT_WORD_COMPLETIONS)       
         return completions
 
@@ -885,4 +1989,4 @@ class UrtextSaveListener(EventListener):
     #     view.run_command('save')
     #     urtext_settings = sublime.load_settings('urtext.sublime-settings')
     #     if urtext_settings.get('save_on_focus_change'):
-    #          self.executor.submit(self._urtext_save, view)
+    #          save_scheduler.schedule(view.file_name(), lambda: self._urtext_save(view))
@@ -1,8 +1,14 @@
 import sublime
 from .sublime_urtext import UrtextTextCommand
-from .sublime_urtext import get_contents, node_id_regex, urtext_get, size_to_groups, size_to_thirds
+from .sublime_urtext import get_contents, node_id_regex, resolve_links, size_to_groups, size_to_thirds
+from .sublime_urtext import get_path, get_setting, link_targets, pushed_revision, urtext_get_optional
+from .sublime_urtext import open_views, view_registry
+from .background import run_in_background
+from collections import OrderedDict
 import re
 import os
+import threading
+import time
 from sublime_plugin import EventListener
 
 class ToggleTraverse(UrtextTextCommand):
@@ -45,6 +51,110 @@ class ToggleTraverse(UrtextTextCommand):
                 index += 1
         self.view.window().focus_group(active_group)
 
+_missing = object()
+
+def cached_link_targets(project, link_ids):
+    """ 
+    the first target among link_ids, as resolve_first_link() would
+    return it, or None if the cache cannot tell without the server
+    """
+    for link in link_ids:
+        target = link_targets.get(project, link, _missing)
+        if target is _missing:
+            return None
+        if target:
+            return [target]
+    return []
+
+def nearby_links(view, lines):
+    """ 
+    link IDs on the lines around the cursor, nearest first, 
+    then those elsewhere in the visible region
+    """
+    row = view.rowcol(view.sel()[0].begin())[0]
+    last_row = view.rowcol(view.size())[0]
+    link_regex = '>(' + node_id_regex + ')'
+    links = []
+    for offset in range(1, lines + 1):
+        for r in [row + offset, row - offset]:
+            if 0 <= r <= last_row:
+                line = view.line(view.text_point(r, 0))
+                links.extend(re.findall(link_regex, view.substr(line)))
+    links.extend(re.findall(link_regex, view.substr(view.visible_region())))
+    return list(OrderedDict.fromkeys(links))
+
+class LinkPrefetcher:
+    """
+    Resolves the links near the cursor in a traverse tree view in the 
+    background, so that stepping onto them opens their targets from 
+    link_targets without a round trip. Unless the server announces 
+    new revisions, the project revision is checked first, at most once
+    every few seconds, so targets cached before a change made outside 
+    Sublime are fetched again (saves invalidate them already). One
+    batch runs per view at a time; requests made meanwhile are 
+    collapsed into the next batch.
+    """
+    def __init__(self):
+        self.running = set()
+        self.waiting = {}
+        self.revision_checked = {}
+        self.lock = threading.Lock()
+
+    def prefetch(self, view, project):
+        lines = get_setting('traverse_prefetch_lines', 20)
+        if not lines:
+            return
+        links = nearby_links(view, lines)
+        with self.lock:
+            if view.id() in self.running:
+                self.waiting[view.id()] = (project, links)
+                return
+            self.running.add(view.id())
+        self._start(view.id(), project, links)
+
+    def _start(self, view_id, project, links):
+        def failed(error):
+            print('Urtext: could not prefetch links (%s)' % error)
+            self._done(view_id)
+        run_in_background(
+            lambda: self._fetch(project, links),
+            callback=lambda result: self._done(view_id),
+            errback=failed)
+
+    def _done(self, view_id):
+        with self.lock:
+            waiting = self.waiting.pop(view_id, None)
+            if not waiting:
+                self.running.discard(view_id)
+                return
+        self._start(view_id, *waiting)
+
+    def _fetch(self, project, links):
+        # servers with an event stream announce new revisions themselves
+        if pushed_revision(project) is None and self._revision_check_due(project):
+            s = urtext_get_optional('revision', {'project' : project})
+            if s is not None and s['revision'] != link_targets.revision(project):
+                link_targets.set_revision(project, s['revision'])
+        revision = link_targets.revision(project)
+        missing = [link for link in links 
+            if link_targets.get(project, link, _missing) is _missing]
+        missing = missing[:get_setting('traverse_prefetch_limit', 200)]
+        if not missing:
+            return
+        for link, target in resolve_links(missing, project=project).items():
+            link_targets.set(project, link, target, revision)
+
+    def _revision_check_due(self, project):
+        interval = get_setting('traverse_revision_check_seconds', 5)
+        now = time.time()
+        with self.lock:
+            if now - self.revision_checked.get(project, 0) < interval:
+                return False
+            self.revision_checked[project] = now
+        return True
+
+link_prefetcher = LinkPrefetcher()
+
 class TraverseFileTree(EventListener):
     def on_selection_modified(self, view):
         
@@ -116,65 +226,88 @@ class TraverseFileTree(EventListener):
             # if there are no links on this line:
             if len(links) == 0:  
                 return
-            # get all the filenames corresponding to the links
-            filenames = []
-            for link in links:
-                s = urtext_get('filename-from-link', {'link' : link[1:]})
-                filename = s['filename']
-                if filename:
-                    filenames.append((s['filename'],s['position']))
-            if len(filenames) > 0:  
-                # and link[1:] in _UrtextProjectList.current_project.nodes:
-                filename = filenames[0][0]
-                position = filenames[0][1]
+            project = get_path(view)
+            link_ids = [link[1:] for link in links]
+            filenames = cached_link_targets(project, link_ids)
+            if filenames is not None:
+                # already prefetched; no round trip needed
+                self.open_link_target(filenames, view, full_line)
+            else:
+                # resolve the links in one round trip; only the first target is used
+                def resolve_first_link():
+                    revision = link_targets.revision(project)
+                    resolved = resolve_links(link_ids, first_only=True, project=project)
+                    for link, target in resolved.items():
+                        link_targets.set(project, link, target, revision)
+                        if target:
+                            # later links were not looked at
+                            break
+                    return [target for target in resolved.values() if target]
+                run_in_background(
+                    resolve_first_link,
+                    callback=lambda filenames: self.open_link_target(
+                        filenames, view, full_line))
+            link_prefetcher.prefetch(view, project)
+
+    def open_link_target(self, filenames, view, full_line):
+        # the cursor may have moved on while the links were resolved
+        if not view.window() or not len(view.sel()):
+            return
+        if view.substr(view.line(view.sel()[0])) != full_line:
+            return
+        this_file = view.file_name()
+        tree_view = view
+        window = view.window()
+        if len(filenames) > 0:  
+            # and link[1:] in _UrtextProjectList.current_project.nodes:
+            filename = filenames[0][0]
+            position = filenames[0][1]
+            
+            """ If the tree is linking to another part of its own file """
+            if filename == os.path.basename(this_file):
                 
-                """ If the tree is linking to another part of its own file """
-                if filename == os.path.basename(this_file):
-                    
-                    instances = self.find_filename_in_window(filename, window)
-                    # Only allow two total instances of this file; 
-                    # one to navigate, one to edit
-                    if len(instances) < 2:
-                        window.run_command("clone_file")
-                        duplicate_file_view = self.find_filename_in_window(filename, window)[1]
-                    if len(instances) >= 2:
-                        duplicate_file_view = instances[1]
+                instances = self.find_filename_in_window(this_file, window)
+                # Only allow two total instances of this file; 
+                # one to navigate, one to edit
+                if len(instances) < 2:
+                    window.run_command("clone_file")
+                    # the clone is made the active view
+                    duplicate_file_view = window.active_view()
+                    view_registry.add(duplicate_file_view)
+                if len(instances) >= 2:
+                    duplicate_file_view = instances[1]
+                
+                """ If the duplicate view is in the content group """
+                if duplicate_file_view in window.views_in_group(self.content_group):
+                    window.focus_view(duplicate_file_view)
+                    duplicate_file_view.show_at_center(position)
+                    duplicate_file_view.sel().clear()
+                    duplicate_file_view.sel().add(position)
                     
-                    """ If the duplicate view is in the content group """
-                    if duplicate_file_view in window.views_in_group(self.content_group):
-                        window.focus_view(duplicate_file_view)
-                        duplicate_file_view.show_at_center(position)
-                        duplicate_file_view.sel().clear()
-                        duplicate_file_view.sel().add(position)
-                        
-                        self.return_to_left(duplicate_file_view, tree_view)
-                        duplicate_file_view.settings().set('traverse', 'false')
-                        return
-                    """ If the duplicate view is in the tree group """
-                    if duplicate_file_view in window.views_in_group(self.tree_group):
-                        window.focus_group(self.tree_group)
-                        duplicate_file_view.settings().set('traverse', 'false')  # this is for the cloned view
-                        window.set_view_index(duplicate_file_view, self.content_group, 0)
-                        duplicate_file_view.show_at_center(position)
-                        window.focus_view(tree_view)
-                        window.focus_group(self.tree_group)
-                        self.restore_traverse(view, tree_view)
-                        return
-                else:
-                    """ The tree is linking to another file """
-                    window.focus_group(self.content_group)
-                    file_view = window.open_file( filename,sublime.TRANSIENT)
-                    file_view.show_at_center(position)
-                    file_view.sel().clear()
-                    file_view.sel().add(position)
+                    self.return_to_left(duplicate_file_view, tree_view)
+                    duplicate_file_view.settings().set('traverse', 'false')
+                    return
+                """ If the duplicate view is in the tree group """
+                if duplicate_file_view in window.views_in_group(self.tree_group):
+                    window.focus_group(self.tree_group)
+                    duplicate_file_view.settings().set('traverse', 'false')  # this is for the cloned view
+                    window.set_view_index(duplicate_file_view, self.content_group, 0)
+                    duplicate_file_view.show_at_center(position)
+                    window.focus_view(tree_view)
                     window.focus_group(self.tree_group)
-                    self.return_to_left(file_view, tree_view)
+                    self.restore_traverse(view, tree_view)
+                    return
+            else:
+                """ The tree is linking to another file """
+                window.focus_group(self.content_group)
+                file_view = window.open_file( filename,sublime.TRANSIENT)
+                file_view.show_at_center(position)
+                file_view.sel().clear()
+                file_view.sel().add(position)
+                window.focus_group(self.tree_group)
+                self.return_to_left(file_view, tree_view)
     def find_filename_in_window(self, filename, window):
-        instances = []
-        for view in window.views():
-            if view.file_name() == filename:
-                instances.append(view)
-        return instances
+        return open_views(filename, window)
     def restore_traverse(self, wait_view, traverse_view):
         if not wait_view.is_loading():
             traverse_view.settings().set('traverse', 'true')
@@ -0,0 +1,60 @@
+"""
+This file is part of Urtext for Sublime Text.
+Urtext is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+Urtext is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with Urtext.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import threading
+
+class ViewRegistry:
+    """
+    Maps each filename to the views that have it open, kept current 
+    by event listeners, so finding a file's views does not mean 
+    looking through every view of every window.
+    """
+    def __init__(self):
+        self.views = {}
+        self.filenames = {}
+        self.lock = threading.Lock()
+
+    def add(self, view):
+        filename = view.file_name()
+        with self.lock:
+            self._remove(view.id())
+            if filename:
+                self.views.setdefault(filename, {})[view.id()] = view
+                self.filenames[view.id()] = filename
+
+    def remove(self, view):
+        with self.lock:
+            self._remove(view.id())
+
+    def _remove(self, view_id):
+        filename = self.filenames.pop(view_id, None)
+        if filename is None:
+            return
+        views = self.views[filename]
+        views.pop(view_id, None)
+        if not views:
+            del self.views[filename]
+
+    def open_views(self, filename, window=None):
+        """ the views of filename, optionally only those in window """
+        with self.lock:
+            views = list(self.views.get(filename, {}).values())
+        views = [view for view in views if view.is_valid()]
+        if window is not None:
+            views = [view for view in views if view.window() == window]
+        return views
+
+    def clear(self):
+        with self.lock:
+            self.views.clear()
+            self.filenames.clear()
@@ -0,0 +1,54 @@
+"""
+This file is part of Urtext for Sublime Text.
+Urtext is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+Urtext is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with Urtext.  If not, see <https://www.gnu.org/licenses/>.
+"""
+import json
+import zlib
+
+try:
+    import msgpack
+except ImportError:
+    # installed as a Package Control dependency where available
+    msgpack = None
+
+MSGPACK_TYPE = 'application/msgpack'
+
+# the largest responses; the 'response_formats' setting overrides these
+DEFAULT_RESPONSE_FORMATS = {
+    'nodes' : 'msgpack',
+    'nodes-since' : 'gzip',
+    'keywords' : 'msgpack',
+    'search' : 'gzip',
+    'get-history' : 'gzip',
+    }
+
+def request_headers(response_format):
+    """
+    headers asking the server for a response format: 'json' (plain),
+    'gzip' (gzip-compressed JSON) or 'msgpack' (gzip-compressed
+    MessagePack, or gzip JSON if msgpack is not installed).
+    """
+    headers = {}
+    if response_format in ['gzip', 'msgpack']:
+        headers['Accept-Encoding'] = 'gzip'
+    if response_format == 'msgpack' and msgpack:
+        headers['Accept'] = MSGPACK_TYPE + ', application/json'
+    return headers
+
+def decode_response(headers, body):
+    """ decodes a response body in whatever format the server chose """
+    headers = dict((k.lower(), v) for k, v in headers)
+    if headers.get('content-encoding', '').lower() == 'gzip':
+        body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    if msgpack and headers.get('content-type', '').startswith(MSGPACK_TYPE):
+        return msgpack.unpackb(body, raw=False)
+    return json.loads(body.decode('utf-8'))